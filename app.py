@@ -7,7 +7,7 @@ from scheduler import sched_gen
 from draw import draw_schedule
 
 qe = query.QueryExecutor()
-sf = sched_gen.ScheduleFactory()
+sf = sched_gen.ScheduleFactory(deterministic=True)
 
 app = flask.Flask(__name__)
 cors = CORS(app)
@@ -71,6 +71,15 @@ def api_room_sched():
             return
     return jsonify(qe.get_room_classes(args["term"], args["room"]))
 
+@app.route("/api/v1/room-scheds/", methods=['GET'])
+def api_room_scheds():
+    args = request.args
+    if not (args.keys() >= {"term","rooms"}):
+        return jsonify({"message":"provide all required query params!"}), 400
+    # rooms is a list like [CAB 243,CAB 265]
+    rooms = args["rooms"][1:-1].split(',')
+    return jsonify(qe.get_rooms_classes(args["term"], rooms))
+
 @app.route("/api/all-rooms-open/", methods=['GET'])
 def api_all_avail_rooms():
     # ensure good request
@@ -78,7 +87,9 @@ def api_all_avail_rooms():
     if not (args.keys() >= {"term","weekday","starttime","endtime"}):
         return jsonify({"message":"provide all required query params!"}), 400
     # Get all distinct classes
-    distinct_rooms = qe.get_available_rooms(args["term"], args["weekday"], args["starttime"], args["endtime"])
+    # optional: only require this many free minutes within the timeframe
+    duration = args.get("duration", type=int)
+    distinct_rooms = qe.get_available_rooms(args["term"], args["weekday"], args["starttime"], args["endtime"], duration)
     return jsonify({"available_rooms": distinct_rooms }), 200
 
 @app.route("/api/v1/draw-sched/", methods=['GET'])
@@ -90,6 +101,10 @@ def api_draw_sched():
     imgpath = draw_schedule.draw_schedule(sched)
     return send_file(imgpath, download_name='schedule.png', mimetype='image/png')
 
+@app.route("/api/v1/cache-stats", methods=['GET'])
+def api_cache_stats():
+    return jsonify(qe.get_cache_stats())
+
 @app.route("/api/v1/last-updated", methods=['GET'])
 def last_updated():
     return {"lastUpdated": qe.get_last_updated()}
@@ -0,0 +1 @@
+# placeholder
\ No newline at end of file
@@ -0,0 +1,21 @@
+import os
+from .lru import LRUCache
+from .sqlite_cache import SQLiteCache
+
+# The CACHE_BACKEND environment variable picks where caches made by make_cache
+# keep their entries: "memory" (the default) keeps them in the process, and
+# "sqlite" keeps them in the SQLite file at CACHE_PATH, shared by every worker
+# process on the host and kept across restarts.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_PATH = os.environ.get('CACHE_PATH',
+    os.path.join(os.path.dirname(__file__), "../local/cache.db"))
+
+# Returns a cache of the configured backend. name tells caches apart when they
+# share a backend, so it must be a valid SQL table name. maxbytes bounds the
+# size of the cached values as LRUCache describes.
+def make_cache(name, maxsize, ttl=None, maxbytes=None):
+    if CACHE_BACKEND == "memory":
+        return LRUCache(maxsize, ttl, maxbytes)
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCache(CACHE_PATH, name, maxsize, ttl, maxbytes)
+    raise ValueError(f"Unknown cache backend '{CACHE_BACKEND}'")
@@ -0,0 +1,71 @@
+import pickle
+from collections import OrderedDict
+from time import monotonic
+
+class LRUCache:
+    # A dict bounded to maxsize entries that evicts the least recently used
+    # entries on overflow. Hit, miss and eviction counts are kept for reporting.
+    # param ttl is an optional lifetime in seconds, after which an entry is
+    #   dropped on its next lookup and counted as an expiration and a miss.
+    # param maxbytes optionally bounds the entries' total size as well, where
+    #   an entry's size is the length of its pickled value. Objects in memory
+    #   take several times that, but it grows with them, and SQLiteCache stores
+    #   exactly those bytes. A value bigger than maxbytes is not kept at all.
+    # shared tells whether other processes see the same entries.
+    shared = False
+
+    def __init__(self, maxsize=1024, ttl=None, maxbytes=None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._maxbytes = maxbytes
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self.hits, self.misses, self.evictions, self.expirations = 0, 0, 0, 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries and not self._expired(key)
+
+    def _expired(self, key):
+        expires = self._entries[key][1]
+        return expires is not None and monotonic() >= expires
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        if self._expired(key):
+            self._bytes -= self._entries.pop(key)[2]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, value):
+        expires = None if self._ttl is None else monotonic() + self._ttl
+        size = 0 if self._maxbytes is None else len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        if self._maxbytes is not None and size > self._maxbytes:
+            return
+        self._entries[key] = (value, expires, size)
+        self._entries.move_to_end(key)
+        self._bytes += size
+        while len(self._entries) > self._maxsize or \
+                (self._maxbytes is not None and self._bytes > self._maxbytes):
+            self._bytes -= self._entries.popitem(last=False)[1][2]
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self._maxsize,
+            "bytes": self._bytes, "maxbytes": self._maxbytes, "ttl": self._ttl,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "expirations": self.expirations}
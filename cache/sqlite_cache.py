@@ -0,0 +1,101 @@
+import pickle
+import sqlite3
+from time import time
+
+class SQLiteCache:
+    # Same interface as LRUCache, but entries live in a table of an SQLite
+    # file, so every process that opens the file shares them and they outlive
+    # restarts. Values are pickled and keys are stored as their repr, so keys
+    # must be built from strings, numbers, booleans and tuples. Each entry
+    # remembers when it was last used, and the least recently used entries are
+    # deleted once the table outgrows maxsize or maxbytes. That check scans the
+    # table, so it only runs every few puts and the table may briefly hold a
+    # few entries more than its bounds allow. Hit, miss, eviction and
+    # expiration counts are kept per process.
+    # param path is the SQLite file, created if missing. Several caches may
+    #   share one file under different table names.
+    # param ttl is an optional lifetime in seconds, as in LRUCache.
+    # param maxbytes optionally bounds the total length of the pickled values,
+    #   as in LRUCache, and is enforced along with maxsize.
+    shared = True
+
+    def __init__(self, path, table, maxsize=1024, ttl=None, maxbytes=None):
+        self._table = table
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._maxbytes = maxbytes
+        self._puts = 0
+        self._evict_every = maxsize // 16 + 1
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value BLOB, expires REAL, used REAL)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_used ON {table} (used)")
+        self.hits, self.misses, self.evictions, self.expirations = 0, 0, 0, 0
+
+    def __len__(self):
+        return self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def __contains__(self, key):
+        row = self._conn.execute(f"SELECT expires FROM {self._table} WHERE key=?",
+            (repr(key),)).fetchone()
+        return row is not None and (row[0] is None or time() < row[0])
+
+    def get(self, key, default=None):
+        key = repr(key)
+        row = self._conn.execute(f"SELECT value, expires FROM {self._table} WHERE key=?",
+            (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        now = time()
+        if row[1] is not None and now >= row[1]:
+            self._conn.execute(f"DELETE FROM {self._table} WHERE key=?", (key,))
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._conn.execute(f"UPDATE {self._table} SET used=? WHERE key=?", (now, key))
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        now = time()
+        expires = None if self._ttl is None else now + self._ttl
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self._maxbytes is not None and len(value) > self._maxbytes:
+            self._conn.execute(f"DELETE FROM {self._table} WHERE key=?", (repr(key),))
+            return
+        self._conn.execute(f"INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?, ?)",
+            (repr(key), value, expires, now))
+        self._puts += 1
+        if self._puts % self._evict_every == 0:
+            self._evict()
+
+    def _evict(self):
+        cursor = self._conn.execute(f"DELETE FROM {self._table} WHERE key IN "
+            f"(SELECT key FROM {self._table} ORDER BY used DESC LIMIT -1 OFFSET ?)", (self._maxsize,))
+        self.evictions += max(cursor.rowcount, 0)
+        if self._maxbytes is None:
+            return
+        excess = self._bytes() - self._maxbytes
+        stale = []
+        for key, size in self._conn.execute(f"SELECT key, length(value) FROM {self._table} ORDER BY used"):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        self._conn.executemany(f"DELETE FROM {self._table} WHERE key=?", stale)
+        self.evictions += len(stale)
+
+    def _bytes(self):
+        return self._conn.execute(f"SELECT COALESCE(SUM(length(value)), 0) FROM {self._table}").fetchone()[0]
+
+    def clear(self):
+        self._conn.execute(f"DELETE FROM {self._table}")
+
+    def stats(self):
+        return {"size": len(self), "maxsize": self._maxsize,
+            "bytes": self._bytes(), "maxbytes": self._maxbytes, "ttl": self._ttl,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "expirations": self.expirations}
@@ -33,7 +33,9 @@ color_scheme = (
     DARKBLUE,
     CYAN,
 )
-day_lookup = {"U": 0, "M": 1, "T": 2, "W": 3, "H": 4, "F": 5, "S": 6}
+# column of each weekday bit of a classtime's dayMask (Monday first), with
+# Sunday in the first column
+weekday_column = (1, 2, 3, 4, 5, 6, 0)
 
 import os
 dirname = os.path.dirname(__file__)
@@ -42,27 +44,12 @@ boilerplate_path = os.path.join(dirname, "./boilerplate.png")
 __draw_sched_font = ImageFont.truetype(tahoma_font_path, 19)
 
 
-def str_t_to_int(str_t):
-    h = int(str_t[0:2])
-    m = int(str_t[3:5])
-    pm = str_t[6:9] == "PM"
-    if pm and h == 12:
-        return h * 60 + m
-    if pm and h < 12:
-        return (h + 12) * 60 + m
-    if not pm and h == 12:
-        return m
-    if not pm and h < 12:
-        return h * 60 + m
-    return None
-
-
 def get_draw_text(course_class, location=""):
-    course_name = course_class["course"]
-    class_component = course_class["component"]
-    class_section = course_class["section"]
-    class_id = course_class["class"]
-    instructor = course_class["instructorName"]
+    course_name = course_class.course
+    class_component = course_class.component
+    class_section = course_class.section
+    class_id = course_class.class_id
+    instructor = course_class.instructor
     if instructor:
         instructor = instructor[2:-2]
     instructor_text = ""
@@ -96,7 +83,9 @@ def get_draw_text(course_class, location=""):
     return text.upper()
 
 
-def draw_schedule(sched):
+# param classes is a list of ClassRecords (see query/records.py), with the
+#   classes of a course next to each other.
+def draw_schedule(classes):
     image = Image.open(boilerplate_path)
     draw = ImageDraw.Draw(image)
     min_y = 2147483647
@@ -104,31 +93,29 @@ def draw_schedule(sched):
     class_on_weekend = False
     course_itr = 0
     curr_course = None
-    classes = sched["objects"]
     for course_class in classes:
-        course_class = course_class["objects"]
-
-        course_id = course_class["course"]
+        course_id = course_class.course
         if course_id != curr_course:
             color = color_scheme[course_itr % len(color_scheme)]
             curr_course = course_id
             course_itr += 1
-        for classtime in course_class["classtimes"]:
-            start_t = str_t_to_int(classtime["startTime"])
-            end_t = str_t_to_int(classtime["endTime"])
-            days = classtime["day"]
-            location = classtime["location"]
+        for classtime in course_class.times:
+            start_t = classtime.start
+            end_t = classtime.end
+            location = classtime.location
             max_y = max(max_y, end_t)
             min_y = min(min_y, start_t)
             if end_t == -1:  # Asynchronous classes
                 continue
-            for day in days:
-                if day == "S" or day == "U":
+            for weekday in range(7):
+                if not (classtime.day_mask >> weekday) & 1:
+                    continue
+                if weekday >= 5:
                     class_on_weekend = True
                 r_x0 = (
                     left_margin_offset
-                    + day_lookup[day] * box_width
-                    + day_lookup[day] * 2
+                    + weekday_column[weekday] * box_width
+                    + weekday_column[weekday] * 2
                 )
                 r_x1 = r_x0 + box_width - 1
 
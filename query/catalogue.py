@@ -0,0 +1,81 @@
+def str_t_to_int(str_t):
+    h = int(str_t[0:2])
+    m = int(str_t[3:5])
+    pm = str_t[6:9] == 'PM'
+    if pm and h==12: return h*60+m
+    if pm and h<12: return (h+12)*60+m
+    if not pm and h==12: return m
+    if not pm and h<12: return h*60+m
+    return None
+
+# e.g. 810 -> "01:30 PM", the inverse of str_t_to_int
+def int_to_str_t(minutes):
+    h, m = divmod(minutes, 60)
+    return f"{(h - 1) % 12 + 1:02d}:{m:02d} {'PM' if h >= 12 else 'AM'}"
+
+# Most ids bound to a single IN (...) query, well below SQLite's limit on
+# host parameters.
+IN_BATCH_SIZE = 500
+
+class SQLiteCatalogue:
+    # Where QueryExecutor reads the catalogue from: every method runs its query
+    # against the database. query/snapshot.py serves the same methods from
+    # memory. Rows are returned as sqlite3 returns them, with columns in the
+    # order listed in formats/uAlberta.json, and in the order they were
+    # imported, whichever index a query goes through. lastUpdated is not read
+    # through here: QueryExecutor checks it on the database itself, since it
+    # is what tells a snapshot is out of date.
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def terms(self):
+        return self._cursor.execute("SELECT * FROM uOfATerm ORDER BY rowid").fetchall()
+
+    # returns (course, asString) pairs
+    def term_courses(self, term):
+        course_query = "SELECT course, asString FROM uOfACourse WHERE term=? ORDER BY rowid"
+        return self._cursor.execute(course_query, (str(term),)).fetchall()
+
+    # returns the term's distinct classtime locations, including empty ones
+    def term_rooms(self, term):
+        location_query = "SELECT location FROM uOfAClassTime WHERE term=? GROUP BY location ORDER BY MIN(rowid)"
+        return [row[0] for row in self._cursor.execute(location_query, (str(term),)).fetchall()]
+
+    def course_name(self, term, course):
+        course_query = "SELECT asString from uOfACourse where term=? AND course=?"
+        row = self._cursor.execute(course_query, (str(term), str(course))).fetchone()
+        return row[0] if row else None
+
+    def course_classes(self, term, course):
+        class_query = "SELECT * FROM uOfAClass WHERE term=? AND course=? ORDER BY rowid"
+        return self._cursor.execute(class_query, (str(term), str(course))).fetchall()
+
+    # The rows and the classtimes of many classes of a term, with one query
+    # per IN_BATCH_SIZE classes. Both return dicts keyed by class ID, where
+    # classes without a row or classtimes are left out.
+    def class_rows(self, term, class_ids):
+        rows = {}
+        for batch in self._batches(class_ids):
+            class_query = f"SELECT * FROM uOfAClass WHERE term=? AND class IN ({','.join('?' * len(batch))})"
+            for row in self._cursor.execute(class_query, (str(term), *batch)).fetchall():
+                rows.setdefault(row[2], row)
+        return rows
+
+    def classtimes_of(self, term, class_ids):
+        rows = {}
+        for batch in self._batches(class_ids):
+            classtime_query = f"SELECT * FROM uOfAClassTime WHERE term=? AND class IN ({','.join('?' * len(batch))}) ORDER BY rowid"
+            for row in self._cursor.execute(classtime_query, (str(term), *batch)).fetchall():
+                rows.setdefault(row[2], []).append(row)
+        return rows
+
+    def _batches(self, class_ids):
+        class_ids = list(dict.fromkeys(class_ids))
+        for i in range(0, len(class_ids), IN_BATCH_SIZE):
+            yield class_ids[i:i+IN_BATCH_SIZE]
+
+    # returns (location, class, dayMask, start, end) for every classtime of the
+    # term, with start and end in minutes after midnight
+    def room_times(self, term):
+        time_query = "SELECT location, class, dayMask, startMin, endMin FROM uOfAClassTime WHERE term=? ORDER BY rowid"
+        return self._cursor.execute(time_query, (str(term),)).fetchall()
@@ -3,11 +3,33 @@ import os, sqlite3, json, sys, logging, requests
 import pytz
 from collections import defaultdict
 from datetime import datetime
+from cache.backends import make_cache
+from cache.lru import LRUCache
+from util.make_local_db import enum_weekday
+from .catalogue import SQLiteCatalogue, int_to_str_t, str_t_to_int
+from .records import class_record
+from .rooms import RoomIndex
+from .snapshot import CatalogueSnapshot
 
 
 DISCORDHOOK = os.environ.get('DISCORDHOOK')
+# Set CATALOGUE_SNAPSHOT=1 to serve the catalogue from an in-memory snapshot
+# (see query/snapshot.py) instead of querying the database on every request.
+CATALOGUE_SNAPSHOT = os.environ.get('CATALOGUE_SNAPSHOT') == '1'
 mst = pytz.timezone('America/Edmonton')
 
+# Bounds of the generated schedule cache: how many requests it holds and how
+# many seconds a result is served before it is generated again.
+SCHEDULE_CACHE_SIZE = 256
+SCHEDULE_CACHE_TTL = 3600
+# How many class objects are cached across all terms, and how many bytes they
+# may take pickled. A full class object pickles to about 700 bytes and a
+# minimal one to about 400, and both take about four times that in memory.
+CLASS_CACHE_SIZE = 100000
+CLASS_CACHE_BYTES = 16 * 1024 * 1024
+# How many courses' class records (see query/records.py) are kept.
+COURSE_RECORDS_SIZE = 4096
+
 DEFAULTPREFS = {
     "ONLINE_CLASSES": True,
     "EVENING_CLASSES": True,
@@ -33,22 +55,15 @@ def send_discord_message(message):
             % (response.status_code, response.text)
         )
 
-def str_t_to_int(str_t):
-    h = int(str_t[0:2])
-    m = int(str_t[3:5])
-    pm = str_t[6:9] == 'PM'
-    if pm and h==12: return h*60+m
-    if pm and h<12: return (h+12)*60+m
-    if not pm and h==12: return m
-    if not pm and h<12: return h*60+m
-    return None
-
 class QueryExecutor:
-    def __init__(self):
+    # param snapshot serves every lookup from a CatalogueSnapshot, which is
+    #   rebuilt and swapped in whole when the database's lastUpdated changes.
+    def __init__(self, snapshot=CATALOGUE_SNAPSHOT):
         dirname = os.path.dirname(__file__)
-        db_path = os.path.join(dirname, "../local/cataloguedb.db")
-        self._conn = sqlite3.connect(db_path, check_same_thread=False)
-        self._cursor = self._conn.cursor()
+        self._db_path = os.path.join(dirname, "../local/cataloguedb.db")
+        self._open_db()
+        self._snapshot = snapshot
+        self._source = CatalogueSnapshot(self._conn.cursor()) if snapshot else SQLiteCatalogue(self._cursor)
         uni_format_path = os.path.join(dirname, "../formats/uAlberta.json")
         university_json_f = open(uni_format_path)
         self._uni_json = json.load(university_json_f)
@@ -57,19 +72,61 @@ class QueryExecutor:
             'section', 'term']
         university_json_f.close()
         logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
-        self._term_class_cache = {}
-        for term_obj in self.get_terms()["objects"]:
-            self._term_class_cache[str(term_obj["term"])] = {}
+        self._class_cache = make_cache("classes", CLASS_CACHE_SIZE, maxbytes=CLASS_CACHE_BYTES)
+        self._schedule_cache = make_cache("schedules", SCHEDULE_CACHE_SIZE, SCHEDULE_CACHE_TTL)
+        # Kept in this process whatever the cache backend, since records are
+        # shared rather than copied out of the cache.
+        self._course_records = LRUCache(COURSE_RECORDS_SIZE)
+        self._room_indexes = {}
+        self._cache_updated = self.get_last_updated()
             
+    # Connects to the catalogue database and remembers which file it is. An
+    # update replaces the file instead of writing to it (see
+    # util/make_local_db.db_update), and an open connection keeps reading the
+    # file it opened, so a new file is only seen through a new connection.
+    # The file is identified before connecting, so that a replacement in
+    # between is noticed on the next refresh rather than missed.
+    def _open_db(self):
+        self._db_inode = os.stat(self._db_path).st_ino
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._cursor = self._conn.cursor()
+
     def get_last_updated(self) -> float:
         res = self._cursor.execute("SELECT lastUpdated FROM meta").fetchone()
         return res[0]
 
+    # Cached class objects and schedules are keyed on the database's
+    # lastUpdated, so a database update makes all of them unreachable, and the
+    # caches of this process are emptied as soon as the update is noticed. In
+    # snapshot mode a new snapshot is loaded first and replaces the old one in
+    # one assignment.
+    # A database file that was replaced is reopened first. The old connection
+    # is left to be closed once no request still uses it. The old file's inode
+    # cannot be reused while it is open, so a changed inode always means a new
+    # file.
+    def _refresh_caches(self):
+        if os.stat(self._db_path).st_ino != self._db_inode:
+            self._open_db()
+            if not self._snapshot:
+                self._source = SQLiteCatalogue(self._cursor)
+        last_updated = self.get_last_updated()
+        if last_updated != self._cache_updated:
+            if self._snapshot:
+                self._source = CatalogueSnapshot(self._conn.cursor())
+            # a shared cache may already hold entries of the new version put
+            # by other processes, and the old ones can no longer be looked up
+            # and are evicted first, so it is left to its LRU bounds
+            for cache in (self._class_cache, self._schedule_cache):
+                if not cache.shared:
+                    cache.clear()
+            self._course_records.clear()
+            self._room_indexes = {}
+            self._cache_updated = last_updated
+
 
     def get_terms(self):
-        term_query = f"SELECT * FROM uOfATerm"
-        self._cursor.execute(term_query)
-        terms = self._cursor.fetchall()
+        self._refresh_caches()
+        terms = self._source.terms()
         json_res = []
         for term in terms:
             json_term = {}
@@ -79,9 +136,8 @@ class QueryExecutor:
         return {"objects":json_res}
     
     def get_term_courses(self, term:int):
-        course_query = f"SELECT course, asString FROM uOfACourse WHERE term=?"
-        self._cursor.execute(course_query, (str(term),))
-        course_rows = self._cursor.fetchall()
+        self._refresh_caches()
+        course_rows = self._source.term_courses(term)
         json_res = []
         for course_row in course_rows:
             json_course = {"course": course_row[0], "asString": course_row[1]}
@@ -89,14 +145,12 @@ class QueryExecutor:
         return {"objects":json_res}
     
     def get_term_rooms(self, term:int):
-        course_query = f"SELECT DISTINCT location FROM uOfAClassTime WHERE term=?"
-        self._cursor.execute(course_query, (str(term),))
-        location_rows = self._cursor.fetchall()
+        self._refresh_caches()
         json_res = []
-        for location_row in location_rows:
-            if not location_row[0]:
+        for location in self._source.term_rooms(term):
+            if not location:
                 continue
-            json_room = {"location": location_row[0]}
+            json_room = {"location": location}
             json_res.append(json_room)
         return {"objects":json_res}
 
@@ -121,81 +175,125 @@ class QueryExecutor:
             i += 1
         return res
 
-    def _get_classtimes(self, term:int,c_class:str):
-        classtime_query = f"SELECT * FROM uOfAClassTime WHERE term=? AND class=?"
-        self._cursor.execute(classtime_query, (str(term), c_class))
-        classtime_rows = self._cursor.fetchall()
+    def _json_classtimes(self, classtime_rows):
         keys = self._uni_json["calendar"]["uOfAClassTime"]
         json_res = []
         for classtime_row in classtime_rows:
             json_classtime = {}
-            for k, attr in enumerate(classtime_row[:-1]):
+            for k, attr in enumerate(classtime_row):
                 key = keys[k]
-                if key not in ("term", "course", "class"):
+                if key not in ("term", "course", "class", "startMin", "endMin", "dayMask"):
                     json_classtime[key] = attr
-            json_classtime["biweekly"] = classtime_row[-1] if classtime_row[-1] else 0
+            json_classtime["biweekly"] = json_classtime["biweekly"] if json_classtime["biweekly"] else 0
             json_res.append(json_classtime)
         self._coalesce_identical_classtimes(json_res)
         return json_res
     
     # Need to check if the preferences still allow of the generation of schedules
     # containing a class from each possible component (e.g. LEC, SEM).
-    def filter_check(self, term:int, course:str, filtered_rows):
-        class_query = "SELECT * FROM uOfAClass WHERE term=? AND course=?"
-        self._cursor.execute(class_query, (str(term), course))
-        all_class_rows = self._cursor.fetchall()
+    def filter_check(self, filtered_records, all_records):
         possible_components = set()
         filtered_components = set()
-        for class_row in all_class_rows:
-            possible_components.add(class_row[3])
-        for class_row in filtered_rows:
-            filtered_components.add(class_row[3])
+        for record in all_records:
+            possible_components.add(record.component)
+        for record in filtered_records:
+            filtered_components.add(record.component)
         return len(possible_components) == len(filtered_components)
-        
-    def get_course_classes(self, term:int, course:str, prefs=DEFAULTPREFS):
-        class_query = "SELECT * FROM uOfAClass WHERE term=? AND course=? "
-        if len(prefs["BLACKLIST"]) > 0:
-            for blacklistClassId in prefs["BLACKLIST"]:
-                class_query += f' AND class!="{blacklistClassId}" '
+
+    # Returns the ClassRecords of every class of a course, built on first use
+    # and cached until the database is updated.
+    def _get_course_records(self, term:int, course:str):
+        key = (str(term), str(course), self._cache_updated)
+        records = self._course_records.get(key)
+        if records is None:
+            class_rows = self._source.course_classes(term, course)
+            classtimes = self._source.classtimes_of(term, [class_row[2] for class_row in class_rows])
+            records = tuple(class_record(class_row, classtimes.get(class_row[2], ()))
+                for class_row in class_rows)
+            self._course_records.put(key, records)
+        return records
+
+    # Returns the records of the classes of a course that prefs allow, or None
+    # if prefs leave no schedule possible.
+    def _get_filtered_records(self, term:int, course:str, prefs):
+        all_records = self._get_course_records(term, course)
+        blacklist = set(prefs["BLACKLIST"])
+        records = [record for record in all_records if record.class_id not in blacklist]
         if prefs["ONLINE_CLASSES"] == False:
-            class_query += " AND instructionMode!=? AND instructionMode!=? "
-            self._cursor.execute(class_query, (str(term), course, "Remote Delivery", "Internet"))
-        else:
-            self._cursor.execute(class_query, (str(term), course))
-        class_rows = self._cursor.fetchall()
-        valid_filters = self.filter_check(term, course, class_rows)
-        if not valid_filters:
+            records = [record for record in records
+                if record.instruction_mode not in (None, "Remote Delivery", "Internet")]
+        if not self.filter_check(records, all_records):
             return None
+        if prefs["EVENING_CLASSES"] == False:
+            all_classes_evening_and_filter = True
+            daytime_records = []
+            for record in records:
+                if record.component == "LEC":
+                    has_evening_class = False
+                    for classtime in record.times:
+                        if 170 <= (classtime.end - classtime.start) <= 180:
+                            has_evening_class = True
+                        else:
+                            all_classes_evening_and_filter = False
+                    if has_evening_class:
+                        continue
+                daytime_records.append(record)
+            if all_classes_evening_and_filter:
+                return None
+            records = daytime_records
+        return records
+
+    def get_course_classes(self, term:int, course:str, prefs=DEFAULTPREFS):
+        self._refresh_caches()
+        records = self._get_filtered_records(term, course, prefs)
+        if records is None:
+            return None
+        class_ids = [record.class_id for record in records]
+        class_rows = self._source.class_rows(term, class_ids)
+        classtimes = self._source.classtimes_of(term, class_ids)
         json_res = []
-        all_classes_evening_and_filter = True
-        for class_row in class_rows:
+        for class_id in class_ids:
             json_class = {}
-            for k, attr in enumerate(class_row):
+            for k, attr in enumerate(class_rows[class_id]):
                 key = self._uni_json["calendar"]["uOfAClass"][k]
                 json_class[key] = attr
-            json_class["classtimes"] = self._get_classtimes(term, json_class["class"])
-            if prefs["EVENING_CLASSES"] == False and json_class["component"] == "LEC":
-                has_evening_class = False
-                for classtime in json_class["classtimes"]:
-                    start_t = str_t_to_int(classtime["startTime"])
-                    end_t = str_t_to_int(classtime["endTime"])
-                    if 170 <= (end_t - start_t) <= 180:
-                        has_evening_class = True
-                    else:
-                        all_classes_evening_and_filter = False
-                if has_evening_class:
-                    continue
+            json_class["classtimes"] = self._json_classtimes(classtimes.get(class_id, []))
             json_res.append(json_class)
-        if prefs["EVENING_CLASSES"] == False and all_classes_evening_and_filter:
-            return None
         return {"objects":json_res}
     
-    def _get_class_obj(self, term:int, class_id:str, loc_filter=None, minimal=False):
-        if class_id in self._term_class_cache[str(term)]:
-            return self._term_class_cache[str(term)][class_id]
-        class_query = f"SELECT * FROM uOfAClass WHERE term=? AND class=?"
-        self._cursor.execute(class_query, (str(term), class_id))
-        class_row = self._cursor.fetchone()
+    # Returns the class objects of class_ids in order. Those that are not cached
+    # yet are loaded together, with one query for their rows and one for their
+    # classtimes. A class object only holds the classtimes in loc_filter if
+    # given, and only the minimal keys if minimal, so both are part of its
+    # cache key.
+    def _get_class_objs(self, term:int, class_ids, loc_filter=None, minimal=False):
+        return self._get_filtered_class_objs(term, [(class_ids, loc_filter)], minimal)[0]
+
+    # Like _get_class_objs for several (class_ids, loc_filter) pairs at once,
+    # loading the classes missing from any of them together. Returns a list of
+    # class objects per pair.
+    def _get_filtered_class_objs(self, term:int, lookups, minimal=False):
+        class_objs = {}
+        for class_ids, loc_filter in lookups:
+            for class_id in class_ids:
+                key = (str(term), class_id, loc_filter, minimal, self._cache_updated)
+                if key not in class_objs:
+                    class_objs[key] = self._class_cache.get(key)
+        missing = [key for key, class_obj in class_objs.items() if class_obj is None]
+        if missing:
+            missing_ids = [key[1] for key in missing]
+            class_rows = self._source.class_rows(term, missing_ids)
+            classtimes = self._source.classtimes_of(term, missing_ids)
+            for key in missing:
+                class_id, loc_filter = key[1], key[2]
+                class_obj = self._build_class_obj(class_rows[class_id], classtimes.get(class_id, []),
+                    loc_filter, minimal)
+                self._class_cache.put(key, class_obj)
+                class_objs[key] = class_obj
+        return [[class_objs[(str(term), class_id, loc_filter, minimal, self._cache_updated)]
+            for class_id in class_ids] for class_ids, loc_filter in lookups]
+
+    def _build_class_obj(self, class_row, classtime_rows, loc_filter=None, minimal=False):
         json_res = {}
         for k, attr in enumerate(class_row):
             key = self._uni_json["calendar"]["uOfAClass"][k]
@@ -203,7 +301,7 @@ class QueryExecutor:
                 continue
             json_res[key] = attr
         json_res["classtimes"] = []
-        classtimes = self._get_classtimes(term, class_id)
+        classtimes = self._json_classtimes(classtime_rows)
         if loc_filter:
             for classtime in classtimes:
                 if classtime["location"] == loc_filter:
@@ -211,16 +309,48 @@ class QueryExecutor:
         else:
             json_res["classtimes"] = classtimes
         json_res["instructorName"] = json_res["instructorUid"]
-        ret_obj = {"objects":json_res}
-        self._term_class_cache[str(term)][class_id] = ret_obj
-        return ret_obj
+        return {"objects":json_res}
     
     def get_course_name(self, term, course_id):
-        course_query = "SELECT asString from uOfACourse where term=? AND course=?"
-        self._cursor.execute(course_query, (str(term), str(course_id)))
-        course_name = self._cursor.fetchone()
-        return course_name[0]
+        course_name = self._source.course_name(term, course_id)
+        if course_name is None:
+            raise KeyError(f"No course {course_id} in term {term}")
+        return course_name
     
+    # Cache key of a schedule request. Course order and blacklist order and
+    # duplicates do not change the generated schedules, lastUpdated makes
+    # results from before a database update unreachable, and factories that
+    # generate differently do not share results.
+    def _schedule_cache_key(self, term, course_id_list, prefs, last_updated, gen_sched):
+        return (str(term), tuple(sorted(course_id_list)), prefs["EVENING_CLASSES"],
+            prefs["ONLINE_CLASSES"], prefs["IDEAL_START_TIME"], prefs["IDEAL_CONSECUTIVE_LENGTH"],
+            prefs["LIMIT"], tuple(sorted(set(prefs["BLACKLIST"]))), last_updated,
+            gen_sched.config_key())
+
+    def _get_course_names(self, term, course_id_list):
+        c_list = []
+        for course_id in course_id_list:
+            try:
+                c_list.append(self.get_course_name(term, course_id))
+            except:
+                pass
+        return c_list
+
+    def _notify_schedule_lookup(self, term, c_list, blacklist):
+        logging.debug(c_list)
+        msg = ', '.join(c_list) + ' lookup in term ' + str(term)
+        if blacklist[0] != '':
+            msg += ' with blacklist [' + ', '.join(blacklist) + ']'
+        send_discord_message(msg)
+
+    def get_cache_stats(self):
+        return {"schedules": self._schedule_cache.stats(), "classes": self._class_cache.stats(),
+            "course_records": self._course_records.stats()}
+
+    # Generated schedules are cached on the normalized request, so gen_sched
+    # should be deterministic (see ScheduleFactory) for a cached result to be
+    # the one a fresh request would get. Results cut short by the factory's
+    # time budget are not cached, so a slow moment is not served for an hour.
     def get_schedules(self, term:int, course_id_list:str, prefs, gen_sched):
         course_id_list = [str(c) for c in course_id_list[1:-1].split(',')]
         prefs_list = prefs if type(prefs) == list else [str(p) for p in prefs[1:-1].split(',')]
@@ -236,103 +366,96 @@ class QueryExecutor:
             "LIMIT": int(prefs_list[4]),
             "BLACKLIST": blacklist
         }
+        self._refresh_caches()
+        cache_key = self._schedule_cache_key(term, course_id_list, prefs, self._cache_updated, gen_sched)
+        cached = self._schedule_cache.get(cache_key)
+        if cached is not None:
+            sched_res, c_list = cached
+            self._notify_schedule_lookup(term, c_list, blacklist)
+            return sched_res
         classes = []
         for course_id in course_id_list:
-            course_classes = self.get_course_classes(term, course_id, prefs)
-            if not course_classes:
+            course_classes = self._get_filtered_records(term, course_id, prefs)
+            if course_classes is None:
                 return {"objects": {"schedules":[], "aliases": [],
                     "errmsg": f"No schedules to display: the provided settings\
                     filtered out all classes for " + self.get_course_name(term, course_id)}}
             classes.append(course_classes)
 
-        c_list = []
-        for course_id in course_id_list:
-            try:
-                c_list.append(self.get_course_name(term, course_id))
-            except:
-                pass
-        logging.debug(c_list)
-        msg = ', '.join(c_list) + ' lookup in term ' + str(term)
-        if blacklist[0] != '':
-            msg += ' with blacklist [' + ', '.join(blacklist) + ']'
-        send_discord_message(msg)
+        c_list = self._get_course_names(term, course_id_list)
+        self._notify_schedule_lookup(term, c_list, blacklist)
 
-        sched_obj = gen_sched.generate_schedules({"objects":classes}, prefs)
+        sched_obj = gen_sched.generate_schedules(classes, prefs, self._cache_updated)
         if "errmsg" in sched_obj:
+            if sched_obj.get("complete", True):
+                self._schedule_cache.put(cache_key, ({"objects":sched_obj}, c_list))
             return {"objects":sched_obj}
         schedules = sched_obj["schedules"]
         json_res = {}
+        class_objs = self._get_class_objs(term, [class_id for schedule in schedules for class_id in schedule],
+            minimal=True)
         json_schedules = []
+        i = 0
         for schedule in schedules:
-            json_sched = []
-            for class_id in schedule:
-                class_obj = self._get_class_obj(term, class_id, minimal=True)
-                json_sched.append(class_obj)
-            json_schedules.append(json_sched)
+            json_schedules.append(class_objs[i:i+len(schedule)])
+            i += len(schedule)
         json_res["schedules"] = json_schedules
         json_res["aliases"] = sched_obj["aliases"]
+        json_res["complete"] = sched_obj["complete"]
+        if json_res["complete"]:
+            self._schedule_cache.put(cache_key, ({"objects":json_res}, c_list))
         return {"objects":json_res}
     
     def get_room_classes(self, term, room):
         print(f"Room '{room}' lookup in term {term}")
         send_discord_message(f"Room '{room}' lookup in term {term}")
-        query = "SELECT class FROM uOfAClassTime WHERE term=? AND location=?"
-        self._cursor.execute(query, (str(term), str(room)))
-        classes = self._cursor.fetchall()
-        json_res = {}
-        json_sched = []
-        for class_id in classes:
-            json_sched.append(self._get_class_obj(term, class_id[0], room))
-        json_res["schedules"] = [json_sched]
-        json_res["aliases"] = {}
-        return {"objects": json_res}
+        return self._get_room_scheds(term, [room])[str(room)]
+
+    # The schedules of several rooms in one response, keyed by room.
+    def get_rooms_classes(self, term, rooms):
+        print(f"Rooms {rooms} lookup in term {term}")
+        send_discord_message(f"Rooms {rooms} lookup in term {term}")
+        return {"objects": self._get_room_scheds(term, rooms)}
+
+    # Returns {room: room schedule as get_room_classes returns it}, with the
+    # classes of every room loaded together.
+    def _get_room_scheds(self, term, rooms):
+        self._refresh_caches()
+        room_index = self._get_room_index(term)
+        rooms = list(dict.fromkeys(str(room) for room in rooms))
+        lookups = [(room_index.room_classes(room), room) for room in rooms]
+        room_scheds = self._get_filtered_class_objs(term, lookups)
+        return {room: {"objects": {"schedules": [json_sched], "aliases": {}}}
+            for room, json_sched in zip(rooms, room_scheds)}
 
-    def get_available_rooms(self, term, weekday, starttime, endtime):
+    def get_available_rooms(self, term, weekday, starttime, endtime, duration=None):
         """
         Gets all the locations available given timeframe,weekday,and term. Organized by building name.
+        With a duration in minutes, a location only needs that long free somewhere in the timeframe,
+        and each one reports the first such window as free_from and free_until.
         """
         print(f"Available room lookup for term {term} on {weekday} from {starttime} to {endtime}")
         send_discord_message(f"Available room lookup for term {term} on {weekday} from {starttime} to {endtime}")
-        # Get all scheduled classes
-        all_classes_today_query = f"SELECT * FROM uOfAClassTime WHERE term=? AND location != ?"
-        self._cursor.execute(all_classes_today_query, (str(term), "Location TBD"))
-        all_classes_today = self._cursor.fetchall()
-        # Get all room info, and which rooms to remove
-        location_dict = self._analyze_classes(all_classes_today, starttime, endtime, weekday)
-        # remove rooms.
+        self._refresh_caches()
+        room_index = self._get_room_index(term)
+        start, end = str_t_to_int(starttime), str_t_to_int(endtime)
+        if duration is None:
+            location_dict = room_index.free_rooms(enum_weekday.get(weekday), start, end)
+        else:
+            location_dict = room_index.free_windows(enum_weekday.get(weekday), start, end, int(duration))
+            for info in location_dict.values():
+                info["free_from"] = int_to_str_t(info["free_from"])
+                info["free_until"] = int_to_str_t(info["free_until"])
         return self._organize_locations(location_dict)
 
-    def _analyze_classes(self, all_classes: list, starttime: str, endtime: str, weekday: str):
-        """
-        Returns a dictionary containing the info for each classroom, along with a set of classrooms to remove.
-        """
-        starttime_as_min_int = str_t_to_int(starttime)
-        endtime_as_min_int = str_t_to_int(endtime)
-
-        class_locations = defaultdict(lambda: {"classes_today": 0, "class_after": False})
-        conflicting_locations = set()
-
-        # Test each class for interesction
-        for classObj in all_classes:
-            classLoc = classObj[3]
-            classWeekday = classObj[6]
-            classStart = str_t_to_int(classObj[7])
-            classEnd = str_t_to_int(classObj[8])
-            # If not in the set, don't do any computation
-            if classLoc in conflicting_locations: continue
-            # Check weekday match
-            if classWeekday == weekday:
-                if starttime_as_min_int < classEnd and classStart < endtime_as_min_int: 
-                    conflicting_locations.add(classLoc)
-                    class_locations.pop(classLoc, None)
-                    continue
-                if endtime_as_min_int <= classStart:
-                    class_locations[classLoc]["class_after"] = True
-                class_locations[classLoc]["classes_today"] += 1
-            else:
-                class_locations[classLoc] # add entry to dict
-
-        return class_locations
+    # The term's RoomIndex, built on its first lookup and dropped with the
+    # other caches when the database is updated.
+    def _get_room_index(self, term):
+        room_index = self._room_indexes.get(str(term))
+        if room_index is None:
+            room_index = RoomIndex(self._source.room_times(term))
+            self._room_indexes[str(term)] = room_index
+        return room_index
 
     def _organize_locations(self, all_locations: dict):
         """
@@ -349,19 +472,14 @@ class QueryExecutor:
             organized_locations[location].sort(key=operator.itemgetter("name"))
         return organized_locations
 
+    # Returns the ClassRecords of the classes of courses not in blacklist, in
+    # course order, for draw_schedule.
     def get_unique_schedule(self, term, courses, blacklist):
         course_id_list = [str(c) for c in courses[1:-1].split(',')]
         blacklist_id_list = [str(c) for c in blacklist[1:-1].split(',')]
-        # for each course, get all its class ids, minus the blacklist, and call _get_class_obj on the remaining ones
+        self._refresh_caches()
         classes_to_include = []
         for course in course_id_list:
-            course_query = f"SELECT class FROM uOfAClass WHERE term=? AND course=?"
-            self._cursor.execute(course_query, (str(term), str(course)))
-            class_set = [x[0] for x in self._cursor.fetchall()]
-            diff = [x for x in class_set if not x in blacklist_id_list]
-            classes_to_include += diff
-        json_sched = []
-        for class_id in classes_to_include:
-            class_obj = self._get_class_obj(term, class_id, minimal=True)
-            json_sched.append(class_obj)
-        return {"objects":json_sched}
+            classes_to_include += [record for record in self._get_course_records(term, course)
+                if not record.class_id in blacklist_id_list]
+        return classes_to_include
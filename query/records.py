@@ -0,0 +1,40 @@
+import sys
+from collections import namedtuple
+
+# The parts of a class that scheduling and drawing need, built once per class
+# from its database rows and then shared by every request, so requests do not
+# build per-class objects of their own. Records are tuples, immutable and
+# compact, with the strings that repeat across classes interned. The first six
+# fields are what the scheduler reads by position.
+# times is a tuple of ClassTimes, with identical classtimes coalesced as in
+# the class JSON (see QueryExecutor._coalesce_identical_classtimes).
+ClassRecord = namedtuple("ClassRecord",
+    "class_id component section campus instructor times course term instruction_mode")
+# start and end are minutes after midnight, day_mask has one bit per weekday
+# with Monday as bit 0, and biweekly is 0 for weekly classtimes.
+ClassTime = namedtuple("ClassTime", "day start end location biweekly day_mask")
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+# param class_row is a uOfAClass row and classtime_rows its uOfAClassTime rows,
+#   with columns as listed in formats/uAlberta.json.
+def class_record(class_row, classtime_rows):
+    times, first_of = [], {}
+    for row in classtime_rows:
+        day, location, start = row[6], row[3], row[10]
+        i = first_of.get((day, start))
+        if i is None:
+            first_of[(day, start)] = len(times)
+            times.append(ClassTime(_intern(day), start, row[11], _intern(location),
+                row[9] if row[9] else 0, row[12]))
+            continue
+        merged = times[i].location
+        if merged and location:
+            if merged != location:
+                times[i] = times[i]._replace(location=f"{merged}, {location}")
+        else:
+            times[i] = times[i]._replace(location=merged if merged else location)
+    return ClassRecord(class_row[2], _intern(class_row[3]), _intern(class_row[4]),
+        _intern(class_row[7]), class_row[6], tuple(times), _intern(class_row[1]),
+        _intern(class_row[0]), _intern(class_row[23]))
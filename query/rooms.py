@@ -0,0 +1,100 @@
+from bisect import bisect_left, bisect_right
+
+class RoomIndex:
+    # Which classes each room of a term holds and when the room is booked,
+    # built once from the term's room_times rows. Room schedules are then read
+    # straight from it, and free rooms are found by bisecting every room's
+    # classtimes on the requested weekday instead of scanning the whole term.
+    # Weekdays are numbered as in dayMask, Monday first, and times are minutes
+    # after midnight. Rooms are kept in the order they first appear in the
+    # rows, which is the order their results are returned in.
+    # param room_times is the (location, class, dayMask, start, end) tuples of
+    #   SQLiteCatalogue.room_times.
+    def __init__(self, room_times):
+        self._classes = {}
+        rooms = {}
+        for location, class_id, day_mask, start, end in room_times:
+            self._classes.setdefault(location, []).append(class_id)
+            if location is None or location == "Location TBD":
+                continue
+            days = rooms.setdefault(location, {})
+            for weekday in range(7):
+                if day_mask >> weekday & 1:
+                    days.setdefault(weekday, []).append((start, end))
+        self._rooms = {location: {weekday: _index_day(times) for weekday, times in days.items()}
+            for location, days in rooms.items()}
+
+    # Returns the class of every classtime held in location, so a class
+    # appears once per classtime.
+    def room_classes(self, location):
+        return self._classes.get(location, [])
+
+    # Returns {location: {"classes_today", "class_after"}} for the rooms with no
+    # class overlapping start to end on weekday. classes_today counts the
+    # room's classtimes on weekday, and class_after tells whether one of them
+    # starts at or after end.
+    def free_rooms(self, weekday, start, end):
+        free = {}
+        for location, days in self._rooms.items():
+            day = days.get(weekday)
+            if day is None:
+                free[location] = {"classes_today": 0, "class_after": False}
+                continue
+            starts, reach = day[0], day[1]
+            # classes starting before end overlap unless all of them are over
+            # by start
+            before_end = bisect_left(starts, end)
+            if before_end and reach[before_end - 1] > start:
+                continue
+            free[location] = {"classes_today": len(starts), "class_after": before_end < len(starts)}
+        return free
+
+    # Like free_rooms, but a room only needs duration free minutes somewhere
+    # between start and end. Each room's entry also holds "free_from" and
+    # "free_until", the first such free window clipped to start and end.
+    def free_windows(self, weekday, start, end, duration):
+        free = {}
+        for location, days in self._rooms.items():
+            day = days.get(weekday)
+            if day is None:
+                window = (start, end) if end - start >= duration else None
+                info = {"classes_today": 0, "class_after": False}
+            else:
+                window = _first_gap(day[2], day[3], start, end, duration)
+                info = {"classes_today": len(day[0]), "class_after": bisect_left(day[0], end) < len(day[0])}
+            if window is None:
+                continue
+            info["free_from"], info["free_until"] = window
+            free[location] = info
+        return free
+
+# Returns the day's classtimes as (starts, reach, busy_starts, busy_ends):
+# starts sorted, reach[i] the latest end among the classtimes up to starts[i],
+# and busy_starts and busy_ends the times the room is booked, with overlapping
+# and touching classtimes merged.
+def _index_day(times):
+    times.sort()
+    starts, reach, busy_starts, busy_ends = [], [], [], []
+    for start, end in times:
+        starts.append(start)
+        reach.append(max(end, reach[-1]) if reach else end)
+        if busy_ends and start <= busy_ends[-1]:
+            busy_ends[-1] = max(busy_ends[-1], end)
+        else:
+            busy_starts.append(start)
+            busy_ends.append(end)
+    return starts, reach, busy_starts, busy_ends
+
+# Returns the first (from, until) between start and end that is at least
+# duration minutes long and outside every busy range, or None.
+def _first_gap(busy_starts, busy_ends, start, end, duration):
+    gap_start = start
+    for i in range(bisect_right(busy_ends, start), len(busy_starts)):
+        if busy_starts[i] >= end:
+            break
+        if busy_starts[i] - gap_start >= duration:
+            return gap_start, busy_starts[i]
+        gap_start = max(gap_start, busy_ends[i])
+    if end - gap_start >= duration:
+        return gap_start, end
+    return None
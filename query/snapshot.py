@@ -0,0 +1,64 @@
+from collections import defaultdict
+
+class CatalogueSnapshot:
+    # The whole catalogue loaded into memory at once, answering the same
+    # methods as SQLiteCatalogue with dict lookups instead of queries. Rows are
+    # the tuples the database returned and keep its order, and lists of rows
+    # are returned as tuples that are shared by every caller. A
+    # snapshot is never modified after it is built, so a newer one can replace
+    # it at any time by assigning it in place of the old.
+    # param cursor is a cursor on the catalogue database.
+    def __init__(self, cursor):
+        self._terms = cursor.execute("SELECT * FROM uOfATerm ORDER BY rowid").fetchall()
+        self._term_courses = defaultdict(list)
+        self._course_names = {}
+        for term, course, as_string in cursor.execute("SELECT term, course, asString FROM uOfACourse ORDER BY rowid"):
+            self._term_courses[term].append((course, as_string))
+            self._course_names[(term, course)] = as_string
+        self._course_classes = defaultdict(list)
+        self._classes = {}
+        for row in cursor.execute("SELECT * FROM uOfAClass ORDER BY rowid"):
+            self._course_classes[(row[0], row[1])].append(row)
+            self._classes[(row[0], row[2])] = row
+        self._term_rooms = defaultdict(dict)
+        self._classtimes = defaultdict(list)
+        self._room_times = defaultdict(list)
+        for row in cursor.execute("SELECT * FROM uOfAClassTime ORDER BY rowid"):
+            term, class_id, location = row[0], row[2], row[3]
+            self._term_rooms[term][location] = None
+            self._classtimes[(term, class_id)].append(row)
+            self._room_times[term].append((location, class_id, row[12], row[10], row[11]))
+        self._terms = tuple(self._terms)
+        for index in (self._term_courses, self._course_classes, self._classtimes,
+                self._room_times):
+            for key, rows in index.items():
+                index[key] = tuple(rows)
+        self._term_rooms = {term: tuple(rooms) for term, rooms in self._term_rooms.items()}
+
+    def terms(self):
+        return self._terms
+
+    def term_courses(self, term):
+        return self._term_courses.get(str(term), ())
+
+    def term_rooms(self, term):
+        return self._term_rooms.get(str(term), ())
+
+    def course_name(self, term, course):
+        return self._course_names.get((str(term), str(course)))
+
+    def course_classes(self, term, course):
+        return self._course_classes.get((str(term), str(course)), ())
+
+    def class_rows(self, term, class_ids):
+        term = str(term)
+        return {class_id: self._classes[(term, class_id)] for class_id in class_ids
+            if (term, class_id) in self._classes}
+
+    def classtimes_of(self, term, class_ids):
+        term = str(term)
+        return {class_id: self._classtimes[(term, class_id)] for class_id in class_ids
+            if (term, class_id) in self._classtimes}
+
+    def room_times(self, term):
+        return self._room_times.get(str(term), ())
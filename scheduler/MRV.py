@@ -1,34 +1,193 @@
+from itertools import product
 from random import shuffle
+from time import monotonic
+
+# Upper bound on the number of valid schedules enumerated for a single request.
+MAX_SCHEDULES = 125000
 
 class MRV_Model:
-    def __init__(self, components, conflicts):
-        self._components = components
+    # param components is a list of components (lists of classes).
+    # param conflicts is a ConflictMatrix covering every class in components.
+    # param rng is an optional random.Random used to shuffle the components, so
+    #   that the enumeration order can be reproduced from a seed.
+    def __init__(self, components, conflicts, rng=None):
+        self.exhausted = False
+        self._components = [list(component) for component in components]
         self._components.sort(key=len)
         for i in range(len(self._components)):
-            shuffle(self._components[i])
+            (rng.shuffle if rng else shuffle)(self._components[i])
         self._conflicts = conflicts
-        self._depth = len(self._components) - 1
-        self.valid_schedules = []
-        self._valid_sched_count = 0
-    
-    def get_valid_schedules(self):
-        return self.valid_schedules
-
-    def _mrv_solve(self, curr, index):
-        for c in self._components[index]:
-            valid_pick = True
-            for c_i in curr:
-                if (c[0], c_i[0]) in self._conflicts:
-                    valid_pick = False
+        self._component_indices = [[conflicts.index(c[0]) for c in component]
+            for component in self._components]
+
+    # Pick the unassigned component with the fewest remaining values and return
+    # a search frame of (component, candidate iterator, domains, unassigned).
+    # If rng is given the candidates are tried in random order.
+    def _branch(self, domains, unassigned, rng=None):
+        k = min(unassigned, key=lambda u: domains[u].bit_count())
+        domain = domains[k]
+        candidates = [i for i in self._component_indices[k] if (domain >> i) & 1]
+        if rng:
+            rng.shuffle(candidates)
+        return (k, iter(candidates), domains, [u for u in unassigned if u != k])
+
+    def _initial_domains(self):
+        domains = []
+        for indices in self._component_indices:
+            domain = 0
+            for i in indices:
+                domain |= 1 << i
+            domains.append(domain)
+        return domains
+
+    # Removes the conflicts of class index i from the domains of the components
+    # in rest. Returns None as soon as any of those domains empties.
+    def _prune(self, domains, i, rest):
+        keep = ~self._conflicts.masks[i]
+        pruned = list(domains)
+        for u in rest:
+            pruned[u] = domains[u] & keep
+            if not pruned[u]:
+                return None
+        return pruned
+
+    # Lazily yields valid schedules as tuples of classes in component order.
+    # A component's domain is the bitmask of the class indices still compatible
+    # with every pick made so far. After each pick the conflicts of the picked
+    # class are removed from every unassigned domain (forward checking), the
+    # branch is abandoned as soon as any domain empties, and the next component
+    # to branch on is the one with the fewest remaining values. The search uses
+    # an explicit stack, so callers may stop consuming at any point.
+    # param deadline is an optional time.monotonic() value after which the
+    #   search stops early. self.exhausted tells whether the whole search space
+    #   was covered.
+    # param subtrees optionally restricts the search to some of the subtrees
+    #   returned by split, searched in the order given.
+    def iter_schedules(self, deadline=None, subtrees=None):
+        self.exhausted = False
+        if subtrees is None:
+            subtrees = [((), self._initial_domains())]
+        classes = self._conflicts.classes
+        for picks, domains in subtrees:
+            for assignment in self._search(domains, deadline, picks=picks):
+                yield tuple(classes[j] for j in assignment)
+            if self._timed_out:
+                return
+        self.exhausted = True
+
+    # Splits the top of the search tree into at least `count` subtrees where
+    # possible, by expanding it a level at a time exactly as the search would.
+    # Returns (picks, domains) pairs, where picks are the (component, class
+    # index) choices leading to a subtree and domains are what remains of every
+    # domain after them. Searching the subtrees one after another visits the
+    # same schedules in the same order as searching the whole tree.
+    def split(self, count):
+        domains = self._initial_domains()
+        if not domains or not all(domains):
+            return []
+        frontier = [((), domains)]
+        while len(frontier) < count:
+            if all(len(picks) == len(self._component_indices) for picks, _ in frontier):
+                break
+            expanded = []
+            for picks, domains in frontier:
+                unassigned = self._unassigned(picks)
+                if not unassigned:
+                    expanded.append((picks, domains))
+                    continue
+                k, candidates, _, rest = self._branch(domains, unassigned)
+                for i in candidates:
+                    pruned = self._prune(domains, i, rest)
+                    if pruned is not None:
+                        expanded.append((picks + ((k, i),), pruned))
+            frontier = expanded
+        return frontier
+
+    def _unassigned(self, picks):
+        assigned = {k for k, _ in picks}
+        return [u for u in range(len(self._component_indices)) if u not in assigned]
+
+    # The depth first search behind iter_schedules and sample_schedules. Yields
+    # the class index picked for every component, given their initial domains
+    # and optionally the (component, class index) picks already made. Sets
+    # self._timed_out if the deadline stopped the search.
+    def _search(self, domains, deadline=None, rng=None, picks=()):
+        self._timed_out = False
+        if not domains or not all(domains):
+            return
+        assignment = [None] * len(domains)
+        for k, i in picks:
+            assignment[k] = i
+        unassigned = self._unassigned(picks)
+        if not unassigned:
+            yield assignment
+            return
+        stack = [self._branch(domains, unassigned, rng)]
+        steps = 0
+        while stack:
+            steps += 1
+            if deadline is not None and steps % 256 == 0 and monotonic() > deadline:
+                self._timed_out = True
+                return
+            k, candidates, domains, rest = stack[-1]
+            i = next(candidates, None)
+            if i is None:
+                stack.pop()
+                continue
+            assignment[k] = i
+            if not rest:
+                yield assignment
+                continue
+            pruned = self._prune(domains, i, rest)
+            if pruned is not None:
+                stack.append(self._branch(pruned, rest, rng))
+
+    # Lazily yields up to `count` valid schedules spread over the whole search
+    # space, for spaces too large to enumerate. The space is split into strata,
+    # one for every compatible choice of classes of the two largest components,
+    # and each stratum is searched depth first with its candidates in random
+    # order. The strata take turns yielding one schedule each, so every section
+    # of those components is represented even when a plain enumeration would
+    # never leave the first few. Strata are disjoint and each is enumerated
+    # without repeats, so no schedule is yielded twice.
+    # param rng is a random.Random, so a sample can be reproduced from a seed.
+    # param deadline is as in iter_schedules. self.exhausted tells whether every
+    #   stratum ran out, i.e. the whole search space was covered.
+    def sample_schedules(self, count, rng, deadline=None):
+        self.exhausted = False
+        domains = self._initial_domains()
+        if not domains or not all(domains):
+            self.exhausted = True
+            return
+        classes = self._conflicts.classes
+        stratified = sorted(range(len(domains)), key=lambda u: -len(self._component_indices[u]))[:2]
+        searches = []
+        for picks in product(*(self._component_indices[u] for u in stratified)):
+            stratum = list(domains)
+            for u, i in zip(stratified, picks):
+                stratum[u] = 1 << i
+            for u, i in zip(stratified, picks):
+                stratum = self._prune(stratum, i, [v for v in range(len(domains)) if v != u])
+                if stratum is None:
                     break
-            if not valid_pick:
+            else:
+                searches.append(self._search(stratum, deadline, rng))
+        rng.shuffle(searches)
+        turn = found = 0
+        while searches and found < count:
+            if deadline is not None and monotonic() > deadline:
+                return
+            turn %= len(searches)
+            assignment = next(searches[turn], None)
+            if assignment is None:
+                if self._timed_out:
+                    return
+                searches.pop(turn)
                 continue
-            if index == self._depth:
-                self.valid_schedules.append(tuple(curr + [c]))
-                self._valid_sched_count += 1
-            if index < self._depth:
-                if self._valid_sched_count <= 125000:
-                    self._mrv_solve(curr + [c], index+1)
-
-    def solve(self):
-        self._mrv_solve([], 0)
+            turn += 1
+            found += 1
+            yield tuple(classes[j] for j in assignment)
+        self.exhausted = not searches
+
+    def is_satisfiable(self):
+        return next(self.iter_schedules(), None) is not None
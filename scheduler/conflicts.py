@@ -0,0 +1,60 @@
+from cache.lru import LRUCache
+from .occupancy import class_occupancy, overlaps
+
+class ConflictMatrix:
+    # Assigns every class a dense integer index and stores, for each class, a
+    # bitmask (a python int) of the indices of all classes it conflicts with.
+    # Testing a candidate against an entire partial schedule is then a single
+    # AND against the union of the masks of the classes picked so far.
+    # param classes is a list of ClassRecords (see query/records.py).
+    # param conflicts is a predicate taking two classes, e.g.
+    #   TermConflictIndex.conflicts. It is evaluated once per unordered pair.
+    def __init__(self, classes, conflicts):
+        self.classes = []
+        self._index = {}
+        for course_class in classes:
+            if course_class[0] in self._index:
+                continue
+            self._index[course_class[0]] = len(self.classes)
+            self.classes.append(course_class)
+        self.masks = [0] * len(self.classes)
+        for i in range(len(self.classes)):
+            for j in range(i+1, len(self.classes)):
+                if conflicts(self.classes[i], self.classes[j]):
+                    self.masks[i] |= 1 << j
+                    self.masks[j] |= 1 << i
+
+    def __len__(self):
+        return len(self.classes)
+
+    def index(self, class_id):
+        return self._index[class_id]
+
+    def add_conflict(self, class_a_id, class_b_id):
+        i, j = self._index[class_a_id], self._index[class_b_id]
+        self.masks[i] |= 1 << j
+        self.masks[j] |= 1 << i
+
+    def conflicts(self, class_a_id, class_b_id):
+        i, j = self._index[class_a_id], self._index[class_b_id]
+        return (self.masks[i] >> j) & 1 == 1
+
+
+class TermConflictIndex:
+    # Conflict lookups for the classes of a single term and catalogue version,
+    # shared by every request for that term. Each class is encoded once as a
+    # weekly occupancy bitmap (see occupancy.py) and kept in a bounded LRU
+    # cache, so a conflict check is a bitwise AND and a long-lived worker does
+    # not accumulate every class it has ever seen.
+    def __init__(self, max_classes=16384):
+        self._occupancy_cache = LRUCache(max_classes)
+
+    def occupancy(self, course_class):
+        occupancy = self._occupancy_cache.get(course_class[0])
+        if occupancy is None:
+            occupancy = class_occupancy(course_class.times)
+            self._occupancy_cache.put(course_class[0], occupancy)
+        return occupancy
+
+    def conflicts(self, class_a, class_b):
+        return overlaps(self.occupancy(class_a), self.occupancy(class_b))
@@ -0,0 +1,211 @@
+from time import monotonic
+from ortools.sat.python import cp_model
+from .scoring import ASSUMED_COMMUTE_TIME
+
+# Objective weights per minute. Starting before the ideal start time is
+# penalized harder than starting after it, mirroring the cubic and quadratic
+# terms of start_err in evaluate_schedule, and idle minutes between classes
+# stand in for time_wasted. gap_err, the distance of each block of back to
+# back classes from prefs["IDEAL_CONSECUTIVE_LENGTH"], is not modelled:
+# blocks are only known once the day's classes are merged, which has no
+# linear form that CP-SAT can search efficiently.
+IDLE_WEIGHT = 2
+EARLY_START_WEIGHT = 3
+LATE_START_WEIGHT = 1
+COMMUTE_WEIGHT = 1
+DAY_MINUTES = 24*60
+
+class CPSATModel:
+    # Finds the best schedules directly with the OR-Tools CP-SAT solver instead
+    # of enumerating every valid schedule and ranking them afterwards. Every
+    # class is a boolean, each component must pick exactly one class,
+    # conflicting classes exclude each other, and the cost of a schedule is a
+    # weighted sum of per-day idle time, start time error and days on campus.
+    # param components is a list of components (lists of classes).
+    # param conflicts is a ConflictMatrix covering every class in components.
+    # param class_blocks maps class IDs to their day times, as built by
+    #   ScheduleFactory._map_classes_to_blocks.
+    def __init__(self, components, conflicts, class_blocks, prefs):
+        self._components = components
+        self.complete = False
+        self._model = cp_model.CpModel()
+        self._picks = {}
+        self._component_of = {}
+        for i, component in enumerate(components):
+            for course_class in component:
+                self._picks[course_class[0]] = self._model.new_bool_var(course_class[0])
+                self._component_of[course_class[0]] = i
+            self._model.add_exactly_one(self._picks[c[0]] for c in component)
+        self._add_conflicts(conflicts)
+        self._add_cost(conflicts, class_blocks, prefs)
+
+    def _add_conflicts(self, conflicts):
+        class_ids = list(self._picks.keys())
+        for a in range(len(class_ids)):
+            for b in range(a+1, len(class_ids)):
+                if conflicts.conflicts(class_ids[a], class_ids[b]):
+                    self._model.add_bool_or([self._picks[class_ids[a]].Not(), self._picks[class_ids[b]].Not()])
+
+    # Every variable here is fixed by the picked classes, so that each schedule
+    # has exactly one cost and schedules can be enumerated by bounding it.
+    def _add_cost(self, conflicts, class_blocks, prefs):
+        model = self._model
+        ideal_start_t = round(prefs["IDEAL_START_TIME"] * 60)
+        day_classes = {}
+        for class_id in self._picks:
+            for day, times in class_blocks[class_id].items():
+                day_classes.setdefault(day, []).append((class_id, times))
+        cost = []
+        for day, classes in day_classes.items():
+            active = model.new_bool_var(f"active_{day}")
+            model.add_max_equality(active, [self._picks[class_id] for class_id, _ in classes])
+            # a day with no classes starts at midnight at the end of the day
+            # and ends at midnight at its start
+            day_start = model.new_int_var(0, DAY_MINUTES, f"start_{day}")
+            day_end = model.new_int_var(0, DAY_MINUTES, f"end_{day}")
+            model.add_min_equality(day_start, [DAY_MINUTES - (DAY_MINUTES - min(t[0] for t in times)) * self._picks[class_id]
+                for class_id, times in classes])
+            model.add_max_equality(day_end, [max(t[1] for t in times) * self._picks[class_id]
+                for class_id, times in classes])
+            busy = self._busy_minutes(day, classes, conflicts)
+            span = model.new_int_var(0, DAY_MINUTES, f"span_{day}")
+            model.add_max_equality(span, [0, day_end - day_start])
+            early = model.new_int_var(0, DAY_MINUTES, f"early_{day}")
+            late = model.new_int_var(0, DAY_MINUTES, f"late_{day}")
+            model.add_max_equality(early, [0, ideal_start_t - day_start])
+            model.add_max_equality(late, [0, day_start - ideal_start_t - DAY_MINUTES + DAY_MINUTES * active])
+            cost += [IDLE_WEIGHT * (span - busy),
+                EARLY_START_WEIGHT * early, LATE_START_WEIGHT * late,
+                COMMUTE_WEIGHT * ASSUMED_COMMUTE_TIME * 2 * active]
+        # busy minutes never exceed the span, so every term is at least 0 and
+        # at most its share of this
+        max_day_cost = (IDLE_WEIGHT + EARLY_START_WEIGHT + LATE_START_WEIGHT) * DAY_MINUTES \
+            + COMMUTE_WEIGHT * ASSUMED_COMMUTE_TIME * 2
+        self._max_cost = max_day_cost * len(day_classes)
+        self._cost = model.new_int_var(0, self._max_cost, "cost")
+        model.add(self._cost == sum(cost))
+        model.minimize(self._cost)
+
+    # Returns the minutes of day covered by at least one picked class, as a
+    # linear expression. Times overlap within a class, and biweekly classes
+    # of alternate weeks may share a slot, so the times are not simply added
+    # up: the day is cut at every start and end, and each piece counts once
+    # if any picked class covers it, as evaluate_schedule merges the times
+    # into blocks. A piece whose classes exclude each other is covered by the
+    # sum of their picks, since at most one of them can be picked.
+    def _busy_minutes(self, day, classes, conflicts):
+        cuts = sorted({t for _, times in classes for time in times for t in time})
+        minutes = {}
+        for a, b in zip(cuts, cuts[1:]):
+            covering = tuple(class_id for class_id, times in classes
+                if any(start <= a and b <= end for start, end in times))
+            if len(covering) > 0:
+                minutes[covering] = minutes.get(covering, 0) + b - a
+        busy = 0
+        for i, (covering, length) in enumerate(minutes.items()):
+            if self._exclusive(covering, conflicts):
+                covered = sum(self._picks[class_id] for class_id in covering)
+            else:
+                covered = self._model.new_bool_var(f"covered_{day}_{i}")
+                self._model.add_max_equality(covered, [self._picks[class_id] for class_id in covering])
+            busy += length * covered
+        return busy
+
+    def _exclusive(self, class_ids, conflicts):
+        for a in range(len(class_ids)):
+            for b in range(a+1, len(class_ids)):
+                if self._component_of[class_ids[a]] != self._component_of[class_ids[b]] \
+                        and not conflicts.conflicts(class_ids[a], class_ids[b]):
+                    return False
+        return True
+
+    # Returns up to `limit` schedules as tuples of classes in component order,
+    # cheapest first, with equal costs ordered by class IDs. The cheapest cost
+    # is found in one optimizing solve, and the schedules are then enumerated
+    # one band of costs at a time, each band in one solve, widening the bands
+    # until at least `limit` schedules are found. A band holding more schedules
+    # than are worth keeping is narrowed instead.
+    # time_limit bounds the total solver time in seconds, or None for no limit.
+    # self.complete tells whether the returned schedules are the `limit`
+    # cheapest, or all of them, rather than the best found before time ran out.
+    def solve(self, limit, time_limit=None):
+        deadline = None if time_limit is None else monotonic() + time_limit
+        collector = _ScheduleCollector(self._components, self._picks, self._cost, 0)
+        status = self._run(self._model, collector, deadline, False)
+        if status != cp_model.OPTIMAL:
+            # out of time, or INFEASIBLE with nothing collected
+            self.complete = status == cp_model.INFEASIBLE
+            return _best(collector.found, limit)
+        self.complete = True
+        # what is returned if time runs out from here on
+        best = collector.found
+        optimum = min(cost for cost, _ in best)
+        # every schedule costing at most too_few
+        cheaper = []
+        too_few, too_many = optimum - 1, None
+        bound = optimum
+        while True:
+            model = self._model.clone()
+            model.clear_objective()
+            model.add_linear_constraint(model.get_int_var_from_proto_index(self._cost.index), too_few + 1, bound)
+            # schedules that cost the same are equally good, so when the band
+            # is a single cost any of them will do
+            keep = limit - len(cheaper) if bound == too_few + 1 else max(limit * 8, 256)
+            collector = _ScheduleCollector(self._components, self._picks, self._cost, keep)
+            status = self._run(model, collector, deadline, True)
+            if status == cp_model.UNKNOWN or (status == cp_model.FEASIBLE and not collector.stopped):
+                self.complete = False
+                return _best(best + cheaper + collector.found, limit)
+            if collector.stopped and bound > too_few + 1:
+                too_many = bound
+                best = cheaper + collector.found
+            else:
+                too_few = bound
+                cheaper += collector.found
+                if len(cheaper) >= limit or bound >= self._max_cost:
+                    return _best(cheaper, limit)
+            if too_many is None:
+                bound = min(optimum + (bound - optimum + 1) * 4, self._max_cost)
+            else:
+                bound = max((too_few + too_many) // 2, too_few + 1)
+
+    def _run(self, model, collector, deadline, enumerate_all):
+        solver = cp_model.CpSolver()
+        solver.parameters.num_workers = 1
+        # the LP relaxation costs more than it prunes on these models,
+        # especially when enumerating
+        solver.parameters.linearization_level = 0
+        solver.parameters.enumerate_all_solutions = enumerate_all
+        if deadline is not None:
+            solver.parameters.max_time_in_seconds = max(deadline - monotonic(), 0)
+        return solver.solve(model, collector)
+
+class _ScheduleCollector(cp_model.CpSolverSolutionCallback):
+    # Keeps the (cost, schedule) of every solution found, and stops the search
+    # once it has more than keep of them (unless keep is 0).
+    def __init__(self, components, picks, cost, keep):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._components = components
+        self._picks = picks
+        self._cost = cost
+        self._keep = keep
+        self.found = []
+        self.stopped = False
+
+    def on_solution_callback(self):
+        schedule = []
+        for component in self._components:
+            for course_class in component:
+                if self.boolean_value(self._picks[course_class[0]]):
+                    schedule.append(course_class)
+                    break
+        self.found.append((self.value(self._cost), tuple(schedule)))
+        if self._keep and len(self.found) > self._keep:
+            self.stopped = True
+            self.stop_search()
+
+def _best(found, limit):
+    ranked = {}
+    for cost, schedule in found:
+        ranked[tuple(c[0] for c in schedule)] = (cost, schedule)
+    return [ranked[ids][1] for ids in sorted(ranked, key=lambda ids: (ranked[ids][0], ids))[:limit]]
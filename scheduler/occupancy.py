@@ -0,0 +1,36 @@
+# Weekly occupancy bitmaps. A week is 7 days of 288 five-minute slots, with bit
+# (day * 288 + slot) set when a class occupies that slot. Biweekly sections
+# only occupy one of the two alternating weeks, so a class is encoded as a
+# pair of bitmaps (week A, week B); weekly sections set the same bits in both.
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# Returns the bitmap of the slots touched by [start_t, end_t) minutes on a
+# weekday, numbered from Monday as 0. Partially covered slots count as occupied.
+def slot_mask(weekday, start_t, end_t):
+    first_slot = start_t // SLOT_MINUTES
+    last_slot = -(-end_t // SLOT_MINUTES)
+    if last_slot <= first_slot:
+        return 0
+    offset = weekday * SLOTS_PER_DAY
+    return ((1 << (last_slot - first_slot)) - 1) << (offset + first_slot)
+
+# param classtimes is the times of a ClassRecord (see query/records.py).
+# Returns a (week_a, week_b) pair of bitmaps.
+def class_occupancy(classtimes):
+    week_a, week_b = 0, 0
+    for classtime in classtimes:
+        biweekly = int(classtime.biweekly)
+        for weekday in range(7):
+            if not classtime.day_mask >> weekday & 1:
+                continue
+            mask = slot_mask(weekday, classtime.start, classtime.end)
+            if biweekly != 2:
+                week_a |= mask
+            if biweekly != 1:
+                week_b |= mask
+    return (week_a, week_b)
+
+def overlaps(occupancy_a, occupancy_b):
+    return bool(occupancy_a[0] & occupancy_b[0] or occupancy_a[1] & occupancy_b[1])
@@ -0,0 +1,34 @@
+import numpy as np
+
+# Column order of the metrics matrix handed to rank_schedules, and the weight
+# of each metric's rank in a schedule's combined score.
+METRICS = ("time_wasted", "time_variance", "gap_err", "start_err")
+RANK_WEIGHTS = np.array([1, 1, 1.5, 1])
+
+# Ranks schedules by their metrics and returns the indices of the best `limit`
+# of them, best first. For every metric the schedules are ordered from worst
+# (largest) to best and given ranks 1..n, so better schedules collect larger
+# ranks; the combined score is the weighted sum of the four ranks. All sorts
+# are stable, so ties keep the order in which schedules were given, exactly as
+# the original sorted(..., reverse=True) passes did.
+# param metrics is an (n, 4) float array with columns in METRICS order.
+def rank_schedules(metrics, limit):
+    n = len(metrics)
+    limit = max(0, min(limit, n))
+    if limit == 0:
+        return np.empty(0, dtype=np.intp)
+    ranks = np.empty(metrics.shape, dtype=np.float64)
+    positions = np.arange(1, n+1, dtype=np.float64)
+    for m in range(metrics.shape[1]):
+        ranks[np.argsort(-metrics[:, m], kind='stable'), m] = positions
+    scores = ranks @ RANK_WEIGHTS
+    if limit < n:
+        # keep everything strictly above the limit-th best score, then fill
+        # with the earliest schedules tied at that score
+        threshold = np.partition(scores, n - limit)[n - limit]
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)[:limit - len(above)]
+        candidates = np.sort(np.concatenate([above, tied]))
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
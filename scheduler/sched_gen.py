@@ -1,110 +1,82 @@
-from random import shuffle
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+from itertools import islice
+from random import Random
+from time import monotonic
+import numpy as np
+from cache.lru import LRUCache
 from . import MRV
+from .conflicts import ConflictMatrix, TermConflictIndex
+from .ranking import METRICS, rank_schedules
+from .scoring import BatchScorer, evaluate_schedule
 
-ASSUMED_COMMUTE_TIME = 30
-
-def str_t_to_int(str_t):
-    h = int(str_t[0:2])
-    m = int(str_t[3:5])
-    pm = str_t[6:9] == 'PM'
-    if pm and h==12: return h*60+m
-    if pm and h<12: return (h+12)*60+m
-    if not pm and h==12: return m
-    if not pm and h<12: return h*60+m
-    return None
-
-class ValidSchedule:
-    def __init__(self, schedule, aliases, blocks, num_pages, prefs):
-        self._schedule = schedule
-        self._aliases = aliases
-        self._blocks = blocks
-        self._num_pages = num_pages
-        self._prefs = prefs
-        self.time_variance, self.time_wasted, self.gap_err, self.start_err = 0,0,0,0
-        self._static_evaluate()
-        self.time_wasted_rank = None
-        self.time_var_rank = None
-        self.gap_err_rank = None
-        self.start_err_rank = None
-        self.overall_rank = None
-        self.score = None
-
-    def _static_evaluate(self):
-        ideal_consec_len = self._prefs["IDEAL_CONSECUTIVE_LENGTH"] * 60
-        ideal_start_t = self._prefs["IDEAL_START_TIME"] * 60
-        start_times, end_times = [], []
-        for day in self._blocks.keys():
-            self.time_wasted += ASSUMED_COMMUTE_TIME * 2
-            day_start_t, day_end_t = self._blocks[day][0][0], self._blocks[day][-1][1]
-            start_times.append(day_start_t)
-            end_times.append(day_end_t)
-            self.start_err += (ideal_start_t - day_start_t) **\
-                (3 if day_start_t < ideal_start_t else 2)
-            day_blocks = self._blocks[day]
-            self.time_wasted += day_end_t - day_start_t
-            for block in day_blocks:
-                block_len = block[1] - block[0]
-                self.time_wasted -= block_len
-                self.gap_err += (block_len - ideal_consec_len) **\
-                    (2 if block_len <= ideal_consec_len else 3)
-        self.start_err = self.start_err / len(self._blocks.keys())
-        avg_start_t = sum(start_times) / len(start_times)
-        avg_end_t = sum(end_times) / len(end_times)
-        start_t_var = sum([(t - avg_start_t) ** 2 for t in start_times]) / len(start_times)
-        end_t_var = sum([(t - avg_end_t) ** 2 for t in end_times]) / len(end_times)
-        self.time_variance = start_t_var * 1.5 + end_t_var
-
-    def set_overall_rank(self):
-        adjusted_combined_rank = \
-            self.time_wasted_rank * 1 + \
-            self.time_var_rank    * 1 + \
-            self.gap_err_rank     * 1.5 + \
-            self.start_err_rank   * 1
-        self.adjusted_score = adjusted_combined_rank
+# Runs in a worker process of ScheduleFactory's pool. Enumerates and evaluates
+# up to limit valid schedules of some subtrees of model (see MRV_Model.split),
+# and returns them as tuples of class indices into the model's conflict matrix,
+# along with their metrics and whether the subtrees were searched to the end.
+def _evaluate_subtrees(model, subtrees, prefs, scorer, deadline, limit):
+    conflict_matrix = model._conflicts
+    valid_schedules = islice(model.iter_schedules(deadline, subtrees), limit)
+    schedules, metrics = ScheduleFactory(scorer=scorer)._evaluate_schedules(valid_schedules, prefs, conflict_matrix)
+    schedules = [tuple(conflict_matrix.index(c[0]) for c in s) for s in schedules]
+    return schedules, metrics, model.exhausted
 
 class ScheduleFactory:
-    def __init__(self, exhaust_threshold=500000):
+    # param scorer selects how schedules are evaluated for ranking: "python"
+    #   scores one schedule at a time, "numpy" scores them in batches with a
+    #   BatchScorer.
+    # param backend selects how schedules are searched: "mrv" enumerates valid
+    #   schedules and ranks them, "cpsat" asks a CP-SAT model for the best
+    #   prefs["LIMIT"] schedules directly (see cpsat.py).
+    # param time_budget is an optional wall clock budget in seconds for each
+    #   call to generate_schedules. When it runs out, the best schedules found
+    #   so far are returned and the response's "complete" flag is False.
+    # param seed is an optional seed for the random choices made while
+    #   generating, so that the same request gives the same schedules.
+    # param deterministic makes generate_schedules a pure function of the term,
+    #   courses and preferences of a request (unless a time_budget cuts it
+    #   short): courses are taken in name order, the seed is derived from the
+    #   request when none is given, and schedules that rank equally are
+    #   ordered by their class IDs instead of at random.
+    # param workers is the number of processes that exhaustive searches are
+    #   split across. With more than one, a process pool is started on first
+    #   use and kept for the lifetime of the factory. Searches that reach
+    #   MAX_SCHEDULES gain the least, since the last runs started may find
+    #   schedules that are cut off, and sampled searches are never split.
+    def __init__(self, exhaust_threshold=500000, scorer="python", backend="mrv", time_budget=None,
+            seed=None, deterministic=False, workers=1):
+        if scorer not in ("python", "numpy"):
+            raise ValueError(f"Unknown scorer '{scorer}'")
+        if backend not in ("mrv", "cpsat"):
+            raise ValueError(f"Unknown backend '{backend}'")
         self._EXHAUST_CARDINALITY_THRESHOLD = exhaust_threshold
-        self._day_index = {'M':0, 'T':1, 'W':2, 'H':3, 'R':3, 'F':4, 'S':5, 'U':6}
-        self._CONFLICTS = set()
-        self._component_blocks = {}
+        self._scorer = scorer
+        self._backend = backend
+        self._time_budget = time_budget
+        self._seed = seed
+        self._deterministic = deterministic
+        self._workers = workers
+        self._pool = None
+        self._conflict_indexes = {}
+        self._canonical_courses = LRUCache(512)
 
-    def _conflicts(self, class_a, class_b):
-        class_a_id, class_b_id = class_a[0], class_b[0]
-        if (class_a_id, class_b_id) in self._CONFLICTS:
-            return True
-        ranges = []
-        for course_class in (class_a, class_b):
-            classtimes = course_class[5]
-            ct_ranges = []
-            for classtime in classtimes:
-                start_t, end_t = classtime[1], classtime[2]
-                for day in classtime[0]:
-                    day_mult = self._day_index[day]
-                    ct_range = (start_t + 2400*day_mult, end_t + 2400*day_mult, classtime[4])
-                    # 7/11/2023: consider a classtime that is an entire superset of the same classtime but in
-                    # a different location. for example, C1 = 9am-5pm in E1-003 and 12pm-5pm in E1-013.
-                    # we should detect this case as a non-conflict (there is a real instance of this).
-                    if len(ct_ranges) > 0:
-                        is_subset = False
-                        for (existing_range, compare_day) in ct_ranges:
-                            if day == compare_day and ct_range[0] >= existing_range[0] and ct_range[1] <= existing_range[1]:
-                                is_subset = True
-                        if not is_subset:
-                            ct_ranges.append((ct_range, day))
-                    else:
-                        ct_ranges.append((ct_range, day))
-            for (ct_range, _) in ct_ranges:
-                ranges.append(ct_range)
-        ranges.sort(key=lambda t: t[0])
-        for i in range(len(ranges)-1):
-            if ranges[i][1] > ranges[i+1][0]:
-                biweekly1, biweekly2 = int(ranges[i][2]), int(ranges[i+1][2])
-                if biweekly1 == 0 or biweekly2 == 0 or (biweekly1 == biweekly2):
-                    self._CONFLICTS.add((class_a_id, class_b_id))
-                    self._CONFLICTS.add((class_b_id, class_a_id))
-                    return True
-        return False
+    # Identifies the settings that decide which schedules are generated, so
+    # results generated by one factory are not taken for another's. workers
+    # and time_budget are left out: the first never changes the results, and
+    # results cut short by the second are not meant to be kept.
+    def config_key(self):
+        return (self._backend, self._scorer, self._seed, self._deterministic,
+            self._EXHAUST_CARDINALITY_THRESHOLD)
+
+    # Conflict indexes are built lazily per term and kept until the catalogue
+    # version changes, so each class is only encoded once per version. The
+    # index knows classes by ID only, and an update may change a class's times.
+    def _conflict_index(self, term, version):
+        cached = self._conflict_indexes.get(term)
+        if cached is None or cached[0] != version:
+            cached = self._conflict_indexes[term] = (version, TermConflictIndex())
+        return cached[1]
 
     def _json_sched(self, sched):
         return [c[0] for c in sched]
@@ -118,55 +90,106 @@ class ScheduleFactory:
             cardinality *= len(component)
         return cardinality
 
-    def _get_schedule_blocks(self, schedule):
+    # Sorts a day's times and joins those at most 15 minutes apart into blocks.
+    def _merge_times(self, times):
+        times = sorted(times)
+        blocks = []
+        block_start, block_end = times[0]
+        for start_t, end_t in times[1:]:
+            if start_t - block_end <= 15:
+                block_end = end_t
+            else:
+                blocks.append((block_start, block_end))
+                block_start, block_end = start_t, end_t
+        blocks.append((block_start, block_end))
+        return tuple(blocks)
+
+    # Builds the per-day blocks of a schedule from the precomputed day times of
+    # its classes (see _map_classes_to_blocks). Days keep the order in which
+    # they first appear. Many schedules share the same classes on a given day,
+    # so merged blocks are memoized in merged_blocks, keyed by the day's times.
+    def _get_schedule_blocks(self, schedule, class_blocks, merged_blocks):
         day_times_map = {}
         for course_class in schedule:
-            for time_tuple in course_class[5]:
-                days, start_t, end_t, _, biweekly = time_tuple
-                for day in days:
-                    if not day in day_times_map:
-                        day_times_map[day] = [(start_t, end_t)]
-                    else:
-                        day_times_map[day].append((start_t, end_t))
-        for times in day_times_map.values():
-            if len(times) == 1:
-                continue
-            times.sort()
-            i = 0
-            while i <= len(times)-2:
-                t_i, t_j = times[i], times[i+1]
-                if t_j[0] - t_i[1] <= 15:
-                    times[i] = (t_i[0], t_j[1])
-                    del times[i+1]
-                    i -= 1
-                i += 1
+            for day, times in class_blocks[course_class[0]].items():
+                if not day in day_times_map:
+                    day_times_map[day] = times
+                else:
+                    day_times_map[day] = day_times_map[day] + times
+        for day, times in day_times_map.items():
+            blocks = merged_blocks.get(times)
+            if blocks is None:
+                blocks = merged_blocks[times] = self._merge_times(times)
+            day_times_map[day] = blocks
         return day_times_map
 
-    def _master_sort(self, schedules, prefs):
-        sched_objs = []
-        num_pages = len(schedules)
+    # Consumes a stream of schedules and evaluates each one as it arrives, so the
+    # raw schedules and their day blocks never have to be held all at once.
+    # Returns the list of schedules and an (n, 4) array of their metrics.
+    def _evaluate_schedules(self, schedules, prefs, conflict_matrix):
+        if self._scorer == "numpy":
+            scorer = BatchScorer(conflict_matrix.classes)
+            evaluated, metrics = [], [np.empty((0, len(METRICS)))]
+            schedules = iter(schedules)
+            while batch := list(islice(schedules, scorer.batch_size)):
+                evaluated += batch
+                metrics.append(scorer.score(batch, prefs))
+            return evaluated, np.concatenate(metrics)
+        class_blocks = self._map_classes_to_blocks(conflict_matrix.classes)
+        merged_blocks = {}
+        evaluated, metrics = [], []
         for schedule in schedules:
-            blocks = self._get_schedule_blocks(schedule)
-            sched_obj = ValidSchedule(schedule, [], blocks, num_pages, prefs)
-            sched_objs.append(sched_obj)
-        time_var_sorted = sorted(sched_objs, key=lambda SO: SO.time_variance, reverse=True)
-        time_waste_sorted = sorted(sched_objs, key=lambda SO: SO.time_wasted, reverse=True)
-        gap_err_sorted = sorted(sched_objs, key=lambda SO: SO.gap_err, reverse=True)
-        start_err_sorted = sorted(sched_objs, key=lambda SO: SO.start_err, reverse=True)
-        for i, sched_obj in enumerate(gap_err_sorted):
-            sched_obj.gap_err_rank = i+1
-        for i, sched_obj in enumerate(time_var_sorted):
-            sched_obj.time_var_rank = i+1
-        for i, sched_obj in enumerate(time_waste_sorted):
-            sched_obj.time_wasted_rank = i+1
-        for i, sched_obj in enumerate(start_err_sorted):
-            sched_obj.start_err_rank = i+1
-        for sched_obj in sched_objs:
-            sched_obj.set_overall_rank()
-        overall_sorted = sorted(sched_objs, key=lambda SO: SO.adjusted_score, reverse=True)
-        overall_sorted = overall_sorted[:min(prefs["LIMIT"], num_pages)]
-        return overall_sorted
-    
+            evaluated.append(schedule)
+            blocks = self._get_schedule_blocks(schedule, class_blocks, merged_blocks)
+            metrics.append(evaluate_schedule(blocks, prefs))
+        return evaluated, np.array(metrics, dtype=np.float64).reshape(-1, len(METRICS))
+
+    # Enumerates and evaluates the valid schedules of mrv_model across the
+    # process pool. The top of the search tree is split into subtrees, a few
+    # per worker to even out their loads, and each worker searches a
+    # contiguous run of them. Runs are concatenated in order and cut off at
+    # MAX_SCHEDULES, so the schedules and their order are exactly those of the
+    # serial search. Schedules are ranked against each other, so workers cannot
+    # keep only their own best and every metric is returned to be ranked here.
+    # Runs are started a wave of one per worker at a time, each stopping at the
+    # number of schedules still missing, and no wave is started once
+    # MAX_SCHEDULES are in, since a run that has started cannot be cancelled.
+    # Returns the schedules, their metrics and whether the search was complete.
+    def _evaluate_parallel(self, mrv_model, prefs, conflict_matrix, deadline):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self._workers)
+        subtrees = mrv_model.split(self._workers * 4)
+        run_size = max(1, -(-len(subtrees) // (self._workers * 4)))
+        runs = [subtrees[i:i+run_size] for i in range(0, len(subtrees), run_size)]
+        classes = conflict_matrix.classes
+        schedules, metrics, complete = [], [np.empty((0, len(METRICS)))], True
+        for wave in range(0, len(runs), self._workers):
+            missing = MRV.MAX_SCHEDULES - len(schedules)
+            if missing <= 0:
+                break
+            futures = [self._pool.submit(_evaluate_subtrees, mrv_model, run, prefs, self._scorer, deadline, missing)
+                for run in runs[wave:wave+self._workers]]
+            for future in futures:
+                run_schedules, run_metrics, exhausted = future.result()
+                schedules += [tuple(classes[j] for j in s) for s in run_schedules]
+                metrics.append(run_metrics)
+                complete = complete and exhausted
+        metrics = np.concatenate(metrics)
+        if len(schedules) >= MRV.MAX_SCHEDULES:
+            complete = False
+        return schedules[:MRV.MAX_SCHEDULES], metrics[:MRV.MAX_SCHEDULES], complete
+
+    # A seed that only depends on the term, the set of courses and the
+    # preferences of a request.
+    def _request_seed(self, term, course_names, prefs):
+        prefs = dict(prefs, BLACKLIST=sorted(set(prefs["BLACKLIST"])))
+        key = json.dumps([term, sorted(course_names), prefs], sort_keys=True)
+        return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+
+    # Returns the best prefs["LIMIT"] schedules, best first.
+    def _master_sort(self, schedules, metrics, prefs):
+        return [schedules[i] for i in rank_schedules(metrics, prefs["LIMIT"])]
+
     # param course_list is a list of strings of form "SUBJ CATALOG" e.g. "CHEM 101".
     # returns a tuple (components, aliases). components is list of components where
     #   a component is all classes belonging to a particular component of a course.
@@ -184,116 +207,210 @@ class ScheduleFactory:
                 component_aliases = {}
                 classtime_to_first_class = {}
                 for component_class in component_classes:
-                    class_comp_str = component_class[1] + ' ' + component_class[2] # e.g., LEC A1
-                    class_times = []
-                    for i in range(len(component_class[5])):
-                        ct_i = component_class[5][i]
-                        class_times.append((ct_i[0], ct_i[1], ct_i[2], ct_i[4]))
-                    class_times = tuple(class_times)
+                    class_comp_str = component_class.component + ' ' + component_class.section # e.g., LEC A1
+                    class_times = tuple((ct.day, ct.start, ct.end, ct.biweekly) for ct in component_class.times)
                     if class_times in classtime_to_first_class:
                         first_class = classtime_to_first_class[class_times]
-                        alias_info = [component_class[0], class_comp_str]
+                        alias_info = [component_class.class_id, class_comp_str]
                         component_aliases[first_class].append(alias_info)
                         aliases[first_class] = component_aliases[first_class]
                     else:
-                        first_class_key = component_class[0]
+                        first_class_key = component_class.class_id
                         classtime_to_first_class[class_times] = first_class_key
                         component_aliases[first_class_key] = []
                         new_component.append(component_class)
                 components.append(new_component)
         return (components, aliases)
 
-    def _create_course_dict(self, courses_obj):
-        attr_tuples = ("class", "component", "section", "campus", "instructorUid")
-        courses = []
-        for course_obj in courses_obj["objects"]:
-            course = {}
-            class_obj = course_obj["objects"]
-            for course_class in class_obj:
-                component = course_class["component"]
-                class_dict = [course_class[attr] for attr in attr_tuples]
-                times = []
-                for i in range(len(course_class["classtimes"])):
-                    ct = course_class["classtimes"][i]
-                    times.append((ct["day"],
-                        str_t_to_int(ct["startTime"]), str_t_to_int(ct["endTime"]),
-                        course_class["location"], ct["biweekly"]))
-                class_dict.append(times)
-                if component in course:
-                    course[component].append(class_dict)
-                else:
-                    course[component] = [class_dict]
-            courses.append(course)
-        return courses
+    # Groups a course's ClassRecords (see query/records.py) by component, in
+    # the order components first appear.
+    def _create_course_dict(self, course_records):
+        course = {}
+        for record in course_records:
+            if record.component in course:
+                course[record.component].append(record)
+            else:
+                course[record.component] = [record]
+        return course
 
-    def _build_conflicts_set(self, components):
+    # Returns the (components, aliases) of a single course, i.e. its sections
+    # collapsed into classes of identical times (see _create_components). The
+    # result only depends on the catalogue version, the term, the course and
+    # the preferences that filter its classes, so it is cached on those and
+    # shared by the pairwise feasibility checks and the full solve of every
+    # request for that course.
+    def _canonical_course(self, course_records, prefs, version):
+        first_class = course_records[0]
+        key = (version, first_class.term, first_class.course, prefs["EVENING_CLASSES"],
+            prefs["ONLINE_CLASSES"], tuple(sorted(set(prefs["BLACKLIST"]))))
+        canonical = self._canonical_courses.get(key)
+        if canonical is None:
+            canonical = self._create_components([self._create_course_dict(course_records)])
+            self._canonical_courses.put(key, canonical)
+        return canonical
+
+    def _build_conflict_matrix(self, components, term, version):
         flat_classes = [e for c in components for e in c]
-        for class_a in flat_classes:
-            for class_b in flat_classes:
-                _ = self._conflicts(class_a, class_b)
+        return ConflictMatrix(flat_classes, self._conflict_index(term, version).conflicts)
+
+    # Returns a dict from class ID to that class's times as a dict from weekday
+    # (0 for Monday, as in day_mask) to a sorted tuple of (start, end) pairs,
+    # computed once per request so that _get_schedule_blocks only has to merge
+    # them.
+    def _map_classes_to_blocks(self, classes):
+        class_blocks = {}
+        for course_class in classes:
+            day_times_map = {}
+            for classtime in course_class.times:
+                start_t, end_t = classtime.start, classtime.end
+                for day in range(7):
+                    if not classtime.day_mask >> day & 1:
+                        continue
+                    if not day in day_times_map:
+                        day_times_map[day] = [(start_t, end_t)]
+                    else:
+                        day_times_map[day].append((start_t, end_t))
+            class_blocks[course_class[0]] = {day: tuple(sorted(times))
+                for day, times in day_times_map.items()}
+        return class_blocks
 
-    def _map_components_to_blocks(self, components):
-        for course_class in components:
-            for component in course_class:
-                if component[0] in self._component_blocks:
+    # ECE 202 and ECE 210 share lab benches, so their labs must be taken in the
+    # same section even though the listed times do not overlap (issue 26).
+    def _add_ece_errata(self, courses, conflict_matrix):
+        for i in range(0, len(courses)):
+            for j in range(i+1, len(courses)):
+                c1, c2 = courses[i], courses[j]
+                c1name, c2name = c1[0].course, c2[0].course
+                if not ((c1name == "ECE 202" and c2name == "ECE 210") or (c2name == "ECE 202" and c1name == "ECE 210")):
                     continue
-                day_times_map = {}
-                for time_tuple in component[5]:
-                    days, start_t, end_t, _, biweekly = time_tuple
-                    for day in days:
-                        if not day in day_times_map:
-                            day_times_map[day] = [(start_t, end_t)]
-                        else:
-                            day_times_map[day].append((start_t, end_t))
-                self._component_blocks[component[0]] = day_times_map
+                for ece_class1 in c1:
+                    for ece_class2 in c2:
+                        if ece_class1.component != "LAB" or ece_class2.component != "LAB":
+                            continue
+                        if ece_class1.section != ece_class2.section:
+                            # aliased sections are not part of the search space
+                            try:
+                                conflict_matrix.add_conflict(ece_class1.class_id, ece_class2.class_id)
+                            except KeyError:
+                                continue
+
+    def _generate_cpsat(self, courses, prefs, course_components, conflict_matrix, aliases, deadline):
+        # imported here so that ortools is only loaded by factories that use it
+        from .cpsat import CPSATModel
+        components = [component for course in course_components for component in course]
+        class_blocks = self._map_classes_to_blocks(conflict_matrix.classes)
+        model = CPSATModel(components, conflict_matrix, class_blocks, prefs)
+        if deadline is None:
+            schedules = model.solve(prefs["LIMIT"])
+        else:
+            schedules = model.solve(prefs["LIMIT"], max(deadline - monotonic(), 0))
+        if len(schedules) == 0 and not model.complete:
+            return {"schedules":[], "aliases":[], "complete": False,
+                "errmsg": "No schedules found in the time available. Try again with fewer courses."}
+        if len(schedules) == 0:
+            return {"schedules":[], "aliases":[],
+                "errmsg": self._diagnose_conflicts(courses, course_components, conflict_matrix)}
+        print(f"CP-SAT: {len(schedules)}")
+        return {"schedules":[[c[0] for c in s] for s in schedules], "aliases":aliases,
+            "complete": model.complete}
+
+    # Explains why a request has no valid schedules. This only runs after the
+    # full solve came back empty, and every check stops at the first valid
+    # schedule it finds. A course that conflicts with itself is reported first,
+    # then every pair of conflicting courses, and otherwise a minimal set of
+    # courses that cannot be taken together, found by dropping each course in
+    # turn and keeping it out whenever the rest still has no valid schedule.
+    def _diagnose_conflicts(self, courses, course_components, conflict_matrix):
+        names = [course_records[0].course for course_records in courses]
+        def satisfiable(course_indices):
+            components = [component for i in course_indices for component in course_components[i]]
+            return MRV.MRV_Model(components, conflict_matrix).is_satisfiable()
+        for i in range(len(names)):
+            if not satisfiable([i]):
+                return f"No valid schedules found. {names[i]} has no conflict-free combination of its own classes."
+        course_conflicts = []
+        for i in range(0, len(names)):
+            for j in range(i+1, len(names)):
+                if not satisfiable([i, j]):
+                    course_conflicts.append(f"{names[i]} conflicts with {names[j]}")
+        if len(course_conflicts) > 0:
+            return "No valid schedules found. " + ', and '.join(course_conflicts) + '.'
+        core = list(range(len(names)))
+        for i in range(len(names)):
+            reduced = [k for k in core if k != i]
+            if len(reduced) > 1 and not satisfiable(reduced):
+                core = reduced
+        # the full set does have a valid schedule if no core is left, or if
+        # nothing could be dropped and it turns out satisfiable, so the search
+        # came back empty for another reason
+        if len(core) < 2 or (len(core) == len(names) and satisfiable(core)):
+            return "No schedules to display: all schedules have time conflicts."
+        core_names = [names[i] for i in core]
+        return "No valid schedules found. " + ', '.join(core_names[:-1]) + \
+            ' and ' + core_names[-1] + ' cannot all be taken together.'
 
-    # Generate valid schedules for a string list of courses. First construct a
+    # Generate valid schedules for a list of courses, each given as the
+    # ClassRecords of its classes (see query/records.py). First construct a
     # a list of components, where a "component" is a set of classes where each
     # class contains information such as class time, id, location, etc, and share
     # a component if they have the same course id and component such as LEC or
-    # LAB. Early exit if the SAT solver proves unsatisfiability. If the size of
+    # LAB. If no valid schedule exists, explain which courses conflict. If the size of
     # possibly valid schedules is within a computational threshold T, then
     # attempt to validate all schedules. If the size exceeds the threshold,
-    # randomly sample from every axis (component) and gather a subset of all
-    # possibly valid schedules of size T.
-    def generate_schedules(self, courses_obj, prefs):
-        course_conflicts = []
-        for i in range(0, len(courses_obj['objects'])):
-            for j in range(i+1, len(courses_obj['objects'])):
-                c1, c2 = courses_obj['objects'][i], courses_obj['objects'][j]
-                obj = {'objects': [c1, c2]}
-                courses_dict = self._create_course_dict(obj)
-                c1name, c2name = c1["objects"][0]["course"], c2["objects"][0]["course"]
-                if (c1name == "ECE 202" and c2name == "ECE 210") or (c2name == "ECE 202" and c1name == "ECE 210"):
-                    for ece_class1 in c1["objects"]:
-                        for ece_class2 in c2["objects"]:
-                            if ece_class1["component"] != "LAB" or ece_class2["component"] != "LAB":
-                                continue
-                            if ece_class1["section"] != ece_class2["section"]:
-                                self._CONFLICTS.add((ece_class1["class"], ece_class2["class"]))
-                                self._CONFLICTS.add((ece_class2["class"], ece_class1["class"]))
-                components, _ = self._create_components(courses_dict)
-                self._build_conflicts_set(components)
-                mrv_model = MRV.MRV_Model(components, self._CONFLICTS)
-                mrv_model.solve()
-                if len(mrv_model.get_valid_schedules()) == 0:
-                    course_conflicts.append(f"{c1['objects'][0]['course']} conflicts with {c2['objects'][0]['course']}")
-        if len(course_conflicts) > 0:
-            return {"schedules":[], "aliases":[],
-                "errmsg": "No valid schedules found. " + ', and '.join(course_conflicts) + '.'}
-        courses_dict = self._create_course_dict(courses_obj)
-        (components, aliases) = self._create_components(courses_dict)
+    # randomly sample up to MAX_SCHEDULES distinct valid schedules instead,
+    # stratified over the sections of the two largest components (see
+    # MRV_Model.sample_schedules).
+    # param version identifies the catalogue the records come from, e.g. its
+    #   lastUpdated. It must change whenever the catalogue does, since what is
+    #   cached across requests is only reused for the same version.
+    def generate_schedules(self, courses, prefs, version=None):
+        deadline = None
+        if self._time_budget is not None:
+            deadline = monotonic() + self._time_budget
+        if self._deterministic:
+            courses = sorted(courses, key=lambda course_records: course_records[0].course)
+        course_components, aliases = [], {}
+        for course_records in courses:
+            components, course_aliases = self._canonical_course(course_records, prefs, version)
+            course_components.append(components)
+            aliases.update(course_aliases)
+        components = [component for course in course_components for component in course]
+        term = str(courses[0][0].term)
+        conflict_matrix = self._build_conflict_matrix(components, term, version)
+        self._add_ece_errata(courses, conflict_matrix)
         cardinality = self._cross_prod_cardinality(components)
         print("Cross product cardinality: " + str(cardinality))
-        self._build_conflicts_set(components)
-        mrv_model = MRV.MRV_Model(components, self._CONFLICTS)
-        mrv_model.solve()
-        valid_schedules = mrv_model.get_valid_schedules()
-        if len(valid_schedules) == 0:
+        if self._backend == "cpsat":
+            return self._generate_cpsat(courses, prefs, course_components, conflict_matrix, aliases, deadline)
+        seed = self._seed
+        if seed is None and self._deterministic:
+            names = [course_records[0].course for course_records in courses]
+            seed = self._request_seed(term, names, prefs)
+        rng = Random(seed)
+        mrv_model = MRV.MRV_Model(components, conflict_matrix, rng)
+        sampled = cardinality > self._EXHAUST_CARDINALITY_THRESHOLD
+        if not sampled and self._workers > 1:
+            schedules, metrics, complete = self._evaluate_parallel(mrv_model, prefs, conflict_matrix, deadline)
+        else:
+            if sampled:
+                valid_schedules = mrv_model.sample_schedules(MRV.MAX_SCHEDULES, rng, deadline)
+            else:
+                valid_schedules = islice(mrv_model.iter_schedules(deadline), MRV.MAX_SCHEDULES)
+            schedules, metrics = self._evaluate_schedules(valid_schedules, prefs, conflict_matrix)
+            complete = mrv_model.exhausted
+        if len(schedules) == 0 and not complete:
+            return {"schedules":[], "aliases":[], "complete": False,
+                "errmsg": "No schedules found in the time available. Try again with fewer courses."}
+        if len(schedules) == 0:
             return {"schedules":[], "aliases":[],
-                "errmsg": "No schedules to display: all schedules have time conflicts."}
-        shuffle(valid_schedules)
-        print(f"Exhaustive (MRV): {len(valid_schedules)}")
-        self._map_components_to_blocks(components)
-        sorted_schedules = self._master_sort(valid_schedules, prefs)
-        return {"schedules":[[c[0] for c in s._schedule] for s in sorted_schedules], "aliases":aliases}
+                "errmsg": self._diagnose_conflicts(courses, course_components, conflict_matrix)}
+        order = list(range(len(schedules)))
+        if self._deterministic:
+            order.sort(key=lambda i: sorted(c[0] for c in schedules[i]))
+        else:
+            rng.shuffle(order)
+        schedules, metrics = [schedules[i] for i in order], metrics[order]
+        print(f"{'Sampled' if sampled else 'Exhaustive'} (MRV): {len(schedules)}")
+        sorted_schedules = self._master_sort(schedules, metrics, prefs)
+        return {"schedules":[[c[0] for c in s] for s in sorted_schedules], "aliases":aliases,
+            "complete": complete}
@@ -0,0 +1,123 @@
+import numpy as np
+
+ASSUMED_COMMUTE_TIME = 30
+
+# Returns the metrics of a schedule from its day blocks, in ranking.METRICS
+# order: (time_wasted, time_variance, gap_err, start_err).
+def evaluate_schedule(blocks, prefs):
+    ideal_consec_len = prefs["IDEAL_CONSECUTIVE_LENGTH"] * 60
+    ideal_start_t = prefs["IDEAL_START_TIME"] * 60
+    time_wasted, gap_err, start_err = 0, 0, 0
+    start_times, end_times = [], []
+    for day in blocks.keys():
+        time_wasted += ASSUMED_COMMUTE_TIME * 2
+        day_start_t, day_end_t = blocks[day][0][0], blocks[day][-1][1]
+        start_times.append(day_start_t)
+        end_times.append(day_end_t)
+        start_err += (ideal_start_t - day_start_t) **\
+            (3 if day_start_t < ideal_start_t else 2)
+        day_blocks = blocks[day]
+        time_wasted += day_end_t - day_start_t
+        for block in day_blocks:
+            block_len = block[1] - block[0]
+            time_wasted -= block_len
+            gap_err += (block_len - ideal_consec_len) **\
+                (2 if block_len <= ideal_consec_len else 3)
+    start_err = start_err / len(blocks.keys())
+    avg_start_t = sum(start_times) / len(start_times)
+    avg_end_t = sum(end_times) / len(end_times)
+    start_t_var = sum([(t - avg_start_t) ** 2 for t in start_times]) / len(start_times)
+    end_t_var = sum([(t - avg_end_t) ** 2 for t in end_times]) / len(end_times)
+    time_variance = start_t_var * 1.5 + end_t_var
+    return (time_wasted, time_variance, gap_err, start_err)
+
+
+# Weekdays of a week, numbered as in day_mask.
+DAYS = range(7)
+_PAD = 1 << 20
+
+class BatchScorer:
+    # Scores whole batches of schedules with NumPy instead of one schedule at a
+    # time. The classtimes of every class are packed once into arrays of shape
+    # classes x days x times; a batch of schedules is gathered from them into
+    # schedules x days x times arrays, sorted per day, and merged into blocks
+    # by a scan over the times axis that is vectorized across the batch.
+    # Results agree with evaluate_schedule up to floating point rounding, so
+    # near-ties may be ranked differently than with the python scorer.
+    # param classes is a list of ClassRecords, e.g. ConflictMatrix.classes.
+    def __init__(self, classes, batch_size=4096):
+        self.batch_size = batch_size
+        self._index = {}
+        day_times = []
+        width = 1
+        for i, course_class in enumerate(classes):
+            self._index[course_class.class_id] = i
+            times = [[] for _ in DAYS]
+            for classtime in course_class.times:
+                for day in DAYS:
+                    if classtime.day_mask >> day & 1:
+                        times[day].append((classtime.start, classtime.end))
+            day_times.append(times)
+            width = max(width, max(len(t) for t in times))
+        self._starts = np.full((len(classes), len(DAYS), width), _PAD, dtype=np.int64)
+        self._ends = np.full((len(classes), len(DAYS), width), _PAD, dtype=np.int64)
+        for i, times in enumerate(day_times):
+            for d, day_t in enumerate(times):
+                for k, (start_t, end_t) in enumerate(day_t):
+                    self._starts[i, d, k], self._ends[i, d, k] = start_t, end_t
+
+    # Returns an (n, 4) array of metrics in ranking.METRICS order.
+    def score(self, schedules, prefs):
+        metrics = [np.empty((0, 4))]
+        for b in range(0, len(schedules), self.batch_size):
+            batch = schedules[b:b+self.batch_size]
+            indices = np.array([[self._index[c[0]] for c in s] for s in batch], dtype=np.intp)
+            metrics.append(self._score_indices(indices, prefs))
+        return np.concatenate(metrics)
+
+    def _score_indices(self, indices, prefs):
+        ideal_consec_len = prefs["IDEAL_CONSECUTIVE_LENGTH"] * 60
+        ideal_start_t = prefs["IDEAL_START_TIME"] * 60
+        n, num_days = len(indices), len(DAYS)
+        starts = self._starts[indices].transpose(0, 2, 1, 3).reshape(n, num_days, -1)
+        ends = self._ends[indices].transpose(0, 2, 1, 3).reshape(n, num_days, -1)
+        order = np.argsort(starts * 2048 + np.minimum(ends, 2047), axis=2, kind='stable')
+        starts = np.take_along_axis(starts, order, axis=2)
+        ends = np.take_along_axis(ends, order, axis=2)
+        valid = starts < _PAD
+
+        def gap_err(block_len):
+            diff = block_len - ideal_consec_len
+            return np.where(block_len <= ideal_consec_len, diff ** 2, diff ** 3)
+
+        # merge sorted times into blocks exactly like _get_schedule_blocks: a
+        # time within 15 minutes of the current block's end extends it
+        active = valid[:, :, 0]
+        day_start = starts[:, :, 0]
+        cur_start, cur_end = starts[:, :, 0], ends[:, :, 0]
+        busy = np.zeros((n, num_days), dtype=np.int64)
+        gaps = np.zeros((n, num_days), dtype=np.int64)
+        for k in range(1, starts.shape[2]):
+            start_k, end_k, valid_k = starts[:, :, k], ends[:, :, k], valid[:, :, k]
+            emit = valid_k & (start_k - cur_end > 15)
+            block_len = cur_end - cur_start
+            busy += np.where(emit, block_len, 0)
+            gaps += np.where(emit, gap_err(block_len), 0)
+            cur_start = np.where(emit, start_k, cur_start)
+            cur_end = np.where(valid_k, end_k, cur_end)
+        block_len = cur_end - cur_start
+        busy += np.where(active, block_len, 0)
+        gaps += np.where(active, gap_err(block_len), 0)
+        day_end = cur_end
+
+        num_active = np.maximum(active.sum(axis=1), 1)
+        time_wasted = np.where(active, ASSUMED_COMMUTE_TIME * 2 + day_end - day_start - busy, 0).sum(axis=1)
+        start_diff = ideal_start_t - day_start
+        start_err = np.where(active, np.where(day_start < ideal_start_t,
+            start_diff ** 3, start_diff ** 2), 0).sum(axis=1) / num_active
+        avg_start_t = np.where(active, day_start, 0).sum(axis=1) / num_active
+        avg_end_t = np.where(active, day_end, 0).sum(axis=1) / num_active
+        start_t_var = np.where(active, (day_start - avg_start_t[:, None]) ** 2, 0).sum(axis=1) / num_active
+        end_t_var = np.where(active, (day_end - avg_end_t[:, None]) ** 2, 0).sum(axis=1) / num_active
+        time_variance = start_t_var * 1.5 + end_t_var
+        return np.stack([time_wasted, time_variance, gaps.sum(axis=1), start_err], axis=1).astype(np.float64)
@@ -8,11 +8,13 @@ from pathlib import Path
 
 term_start_dates = {}
 year_str = str(datetime.now().year)
+# Weekday of each day letter, Monday first. H and R both stand for Thursday.
+# Also the bit of each day in dayMask, and the weekdays QueryExecutor takes.
+enum_weekday = {"M": 0, "T": 1, "W": 2, "H": 3, "R": 3, "F": 4, "S": 5, "U": 6}
 
 
 def days_in_date_range(day, range_start, range_end):
     # Returns a list of dates that a 'day', e.g. 'M', occurs in the range of dates
-    enum_weekday = {"M": 0, "T": 1, "W": 2, "H": 3, "R": 3, "F": 4, "S": 5, "U": 6}
     weekday = enum_weekday[day]
     d_s = datetime.strptime(range_start, "%Y-%m-%d")
     d_e = datetime.strptime(range_end, "%Y-%m-%d")
@@ -24,6 +26,21 @@ def days_in_date_range(day, range_start, range_end):
     return set(dates)
 
 
+def time_to_minutes(time_str):
+    # e.g. "01:30 PM" -> 810, as stored in startMin and endMin
+    t = time.strptime(time_str, "%I:%M %p")
+    return t.tm_hour * 60 + t.tm_min
+
+
+def days_to_mask(days):
+    # e.g. "MWF" -> 0b10101, one bit per weekday with Monday as bit 0, as
+    # stored in dayMask
+    mask = 0
+    for day in days:
+        mask |= 1 << enum_weekday[day]
+    return mask
+
+
 def is_valid_key(k):
     """
     key = (day of week, start time, end time, location)
@@ -141,9 +158,10 @@ def process_and_write(raw_class_obj, db_cursor):
                         biweekly = 1 if (datetimes[0] - term_start_dates[str(termId)]).days < 0 else 2
             # biweekly = None # temporarily disable biweekly classes
             day, start_t, end_t, location = dsel
-            query = "INSERT INTO uOfAClassTime Values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            query = "INSERT INTO uOfAClassTime Values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
             db_cursor.execute(query, (termId, courseId, classId, location, None, None,
-                                      day, start_t, end_t, biweekly))
+                                      day, start_t, end_t, biweekly,
+                                      time_to_minutes(start_t), time_to_minutes(end_t), days_to_mask(day)))
 
     # Write a new class for this course
     query = "INSERT INTO uOfAClass Values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,\
@@ -177,9 +195,47 @@ def initialize_db(db_cursor):
     db_cursor.execute(
         f"CREATE TABLE uOfAClassTime(term TEXT, course TEXT,\
     class TEXT, location TEXT, startDate TEXT, endDate TEXT, day TEXT, startTime TEXT,\
-    endTime TEXT, biweekly TEXT)"
+    endTime TEXT, biweekly TEXT, startMin INTEGER, endMin INTEGER, dayMask INTEGER)"
     )
     db_cursor.execute(f"CREATE TABLE meta(lastUpdated FLOAT)")
+    create_indexes(db_cursor)
+
+
+# Indexes for the lookups made while importing and by QueryExecutor. Tables keep
+# their rowids rather than being WITHOUT ROWID, since responses list terms,
+# courses, classes and classtimes in the order they were imported. Entries with
+# equal keys are stored in rowid order, so lookups through an index still see
+# them in that order. Rooms need no index, since QueryExecutor reads all of a
+# term's classtimes once and indexes them by room itself.
+def create_indexes(db_cursor):
+    db_cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS uOfACourse_course ON uOfACourse(term, course)")
+    db_cursor.execute("CREATE INDEX IF NOT EXISTS uOfAClass_course ON uOfAClass(term, course)")
+    db_cursor.execute("CREATE INDEX IF NOT EXISTS uOfAClass_class ON uOfAClass(term, class)")
+    db_cursor.execute("CREATE INDEX IF NOT EXISTS uOfAClassTime_class ON uOfAClassTime(term, class)")
+
+
+# Brings a database built by an older version of this script up to date in
+# place: fills in the startMin, endMin and dayMask classtime columns from the
+# display strings, drops indexes that are no longer used and creates missing
+# ones.
+def upgrade_db(db_path):
+    db_conn = sqlite3.connect(db_path)
+    db_cursor = db_conn.cursor()
+    classtime_columns = [row[1] for row in db_cursor.execute("PRAGMA table_info(uOfAClassTime)")]
+    if "startMin" not in classtime_columns:
+        db_conn.create_function("time_to_minutes", 1, time_to_minutes)
+        db_conn.create_function("days_to_mask", 1, days_to_mask)
+        for column in ("startMin", "endMin", "dayMask"):
+            db_cursor.execute(f"ALTER TABLE uOfAClassTime ADD COLUMN {column} INTEGER")
+        db_cursor.execute("UPDATE uOfAClassTime SET startMin=time_to_minutes(startTime),\
+    endMin=time_to_minutes(endTime), dayMask=days_to_mask(day)")
+    for old_index in ("uOfAClassTime_location", "uOfAClassTime_room"):
+        db_cursor.execute(f"DROP INDEX IF EXISTS {old_index}")
+    create_indexes(db_cursor)
+    db_cursor.execute("ANALYZE")
+    db_conn.commit()
+    db_cursor.execute("VACUUM")
+    db_conn.close()
 
 
 def retrieve_term_start_dates():
@@ -226,9 +282,15 @@ def db_update():
         default=default_db_path,
     )
     parser.add_argument("--raw", "-r", help="raw.json path", default=default_raw_path)
+    parser.add_argument("--upgrade", "-u", action="store_true",
+        help="bring an existing db up to date instead of importing raw.json")
     args = parser.parse_args()
     db_path = Path(args.db).resolve()
     raw_path = Path(args.raw).resolve()
+    if args.upgrade:
+        print(f"Upgrading db at: {db_path}")
+        upgrade_db(db_path)
+        return
     print(f"Using db path: {db_path}")
     print(f"Using raw.json path: {raw_path}")
 
@@ -256,10 +318,12 @@ def db_update():
     for raw_class_obj in courses:
         process_and_write(raw_class_obj, db_cursor)
     prune_db(db_cursor)
+    db_cursor.execute("ANALYZE")
 
     db_conn.commit()
     db_conn.close()
     db_path.rename(final_db_path)
 
 
-db_update()
+if __name__ == "__main__":
+    db_update()